@@ -1,3 +1,4 @@
+import re
 from enum import Enum
 
 
@@ -21,3 +22,36 @@ def stylize(color, content, style=Style.PLAIN):
     style_code = style.value
     color_code = color.value
     return f"\033[{style_code};{color_code}m{content}\033[0m"
+
+
+ANSI_PATTERN = re.compile(r"\033\[[0-9;]*[A-Za-z]")
+
+
+def strip_ansi(content):
+    return ANSI_PATTERN.sub("", content)
+
+
+def move_cursor(row, column=1):
+    return f"\033[{row};{column}H"
+
+
+def clear_line():
+    # Clears from the cursor to the end of the line
+    return "\033[K"
+
+
+def clear_below():
+    # Clears from the cursor to the end of the screen
+    return "\033[J"
+
+
+def clear_screen():
+    # Also clears the scrollback, like the clear command
+    return "\033[H\033[2J\033[3J"
+
+
+def set_scroll_region(top=None, bottom=None):
+    # Without arguments the whole screen scrolls again
+    if top is None:
+        return "\033[r"
+    return f"\033[{top};{bottom}r"
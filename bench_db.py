@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import statistics
+import db
+from db import init_db, get_db, close_db, check_cache
+from textnorm import normalize_answer
+
+
+# Benchmark config
+ANSWERS = 1_000_000
+SENTENCES = 50_000
+LOOKUPS = 2_000
+UNINDEXED_LOOKUPS = 20
+
+
+def fill_answers(answers, sentences):
+    connection = get_db()
+    rows = []
+    for i in range(answers):
+        content = f"The dog number {i} runs home."
+        rows.append((i % sentences + 1, content, normalize_answer(content)))
+    connection.executemany("INSERT INTO answer (sentence_id, content, normalized) VALUES (?, ?, ?)", rows)
+    connection.commit()
+
+
+def time_lookups(lookups, answers, sentences, reconnect=False):
+    timings = []
+    for _ in range(lookups):
+        i = random.randrange(answers)
+        start = time.perf_counter()
+        if reconnect:
+            close_db()
+        check_cache(i % sentences + 1, f"the dog number {i} runs home")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p50 = statistics.median(timings) * 1000
+    p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+    print(f"{label}: p50 {p50:.3f} ms, p95 {p95:.3f} ms ({len(timings)} lookups)")
+
+
+def main():
+    answers = int(sys.argv[1]) if len(sys.argv) > 1 else ANSWERS
+    db_fd, db_path = tempfile.mkstemp(suffix=".sqlite")
+    db.DB = db_path
+    try:
+        init_db()
+        start = time.perf_counter()
+        fill_answers(answers, SENTENCES)
+        print(f"Inserted {answers} answers in {time.perf_counter() - start:.1f}s")
+        report("Indexed lookup", time_lookups(LOOKUPS, answers, SENTENCES))
+        report("Indexed lookup, new connection per call", time_lookups(LOOKUPS, answers, SENTENCES, reconnect=True))
+        get_db().execute("DROP INDEX answer_sentence_normalized")
+        report("Unindexed lookup", time_lookups(UNINDEXED_LOOKUPS, answers, SENTENCES))
+    finally:
+        close_db()
+        os.close(db_fd)
+        for path in [db_path, db_path + "-wal", db_path + "-shm"]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import db
+from db import init_db, close_db
+from llm import set_backend, call_log, summarize_calls
+from fakebackend import FakeBackend
+from generation import request_story
+from grading import grade_answer
+
+
+# Benchmark config. Runs simulated sessions against the fake backend, so no
+# API key or network is needed.
+SESSIONS = 20
+CONCURRENCY = 4
+LATENCY_SECONDS = 0.05
+ERROR_RATE = 0.05
+# Invalid responses are retried after INITIAL_DELAY_SECONDS, which dwarfs
+# everything else, so they are off by default.
+INVALID_RATE = 0.0
+RETRY_DELAY_SECONDS = 0.1
+MODEL = "gemini-2.5-flash"
+
+
+def run_session(number):
+    # Generates a story and checks one answer per sentence
+    start = time.perf_counter()
+    story = request_story("A1", None, None, MODEL, lambda message: None)
+    context = dict(mode="full", cache=None, text=" ".join(sentence.german for sentence in story.sentences))
+    for sentence in story.sentences:
+        grade_answer(sentence, f"Answer {number} to sentence {sentence.id}", context, MODEL, lambda message: None)
+    close_db()
+    return time.perf_counter() - start
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else SESSIONS
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else CONCURRENCY
+    os.environ.setdefault("KUMPEL_RATE_LIMITS", "off")
+    os.environ["KUMPEL_RESPONSE_CACHE"] = "off"
+    set_backend(FakeBackend(
+        latency=LATENCY_SECONDS,
+        error_rate=ERROR_RATE,
+        invalid_rate=INVALID_RATE,
+        retry_delay=RETRY_DELAY_SECONDS,
+        seed=1,
+    ))
+    db_fd, db_path = tempfile.mkstemp(suffix=".sqlite")
+    db.DB = db_path
+    try:
+        init_db()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            timings = sorted(executor.map(run_session, range(sessions)))
+        elapsed = time.perf_counter() - start
+        summary = summarize_calls(call_log)
+        retries = sum(record["attempts"] - 1 for record in call_log)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{sessions} sessions, {concurrency} at a time: {elapsed:.2f}s, {sessions / elapsed:.1f} sessions/s")
+        print(f"Session: p50 {statistics.median(timings):.2f}s, p95 {p95:.2f}s")
+        print(f"Calls: {summary['calls']} in {summary['seconds']:.2f}s, {retries} retries, {summary['wait_seconds']:.2f}s waiting")
+    finally:
+        close_db()
+        os.close(db_fd)
+        for path in [db_path, db_path + "-wal", db_path + "-shm"]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
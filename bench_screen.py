@@ -0,0 +1,73 @@
+import os
+import time
+import statistics
+import subprocess
+from ansitext import Style, Color, stylize
+from screen import Screen
+from main import get_screen_lines
+
+
+# Benchmark config
+SENTENCES = 50
+COLUMNS = "120"
+LINES = "40"
+HEADER = stylize(Color.YELLOW, " ", Style.BOLD) + stylize(Color.CYAN, "Start") + stylize(Color.CYAN, " Story: ") + "Ein Tag im Park"
+
+
+class CountingOutput:
+    def __init__(self, output):
+        self.output = output
+        self.written = 0
+
+    def write(self, content):
+        self.written += len(content)
+        self.output.write(content)
+
+    def flush(self):
+        self.output.flush()
+
+
+def render_full(output, story_progress):
+    # The previous new_screen: clear the terminal, then reprint everything
+    subprocess.run(["clear"], stdout=output)
+    frame = HEADER + " \n\n"
+    frame += stylize(Color.YELLOW, "Progress", Style.UNDERLINE) + stylize(Color.YELLOW, f" ({len(story_progress)}/{SENTENCES})") + "\n"
+    frame += "".join(sentence + "\n" for sentence in story_progress)
+    frame += "\n"
+    output.write(frame)
+    output.flush()
+    return len(frame)
+
+
+def render_incremental(screen, output, story_progress):
+    start = output.written
+    screen.render(get_screen_lines(HEADER, story_progress, SENTENCES, screen.get_max_lines()))
+    return output.written - start
+
+
+def run(label, render):
+    story_progress = []
+    timings = []
+    written = 0
+    for i in range(SENTENCES):
+        story_progress.append(f"Das ist der Satz Nummer {i + 1} in einer langen Geschichte.")
+        start = time.perf_counter()
+        written += render(story_progress)
+        timings.append(time.perf_counter() - start)
+    p50 = statistics.median(timings) * 1000
+    last = timings[-1] * 1000
+    print(f"{label}: p50 {p50:.3f} ms, last frame {last:.3f} ms, {written} bytes written ({SENTENCES} frames)")
+
+
+def main():
+    os.environ["COLUMNS"] = COLUMNS
+    os.environ["LINES"] = LINES
+    with open(os.devnull, "w") as output:
+        run("clear and reprint", lambda story_progress: render_full(output, story_progress))
+        output = CountingOutput(output)
+        screen = Screen(output)
+        run("Incremental", lambda story_progress: render_incremental(screen, output, story_progress))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+import statistics
+import db
+from db import init_db, close_db, save_story
+from llm import set_backend, call_log
+from fakebackend import FakeBackend, FAKE_SENTENCES
+from schemas import Story, StorySentence
+from grading import cache_stats
+from server import KumpelServer
+
+
+# Benchmark config. Learners work through a saved story against the fake
+# backend, so no API key or network is needed.
+LEARNERS = 50
+CONCURRENCY = 10
+LATENCY_SECONDS = 0.2
+SERVER_WORKERS = 16
+# Share of learners who give the same common wrong answer to every sentence,
+# which the server checks once per sentence while it is in flight
+COMMON_ANSWER_RATE = 0.5
+COMMON_ANSWER = "It is a day"
+
+
+class Client:
+    # A keep-alive HTTP/1.1 JSON client
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        content = json.dumps(body).encode() if body is not None else b""
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(content)}\r\n\r\n".encode() + content
+        )
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line == b"\r\n":
+                break
+            name, value = line.decode().split(":", 1)
+            if name.lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+async def run_learner(port, number, story_id, grading_timings, common):
+    # Answers every sentence with a new translation, so each one is graded,
+    # or with the common answer
+    answer = COMMON_ANSWER if common else f"Learner {number} says something else entirely"
+    client = Client(port)
+    try:
+        status, session = await client.request("POST", "/sessions", dict(story_id=story_id, mode="test"))
+        while not session["done"]:
+            start = time.perf_counter()
+            status, result = await client.request(
+                "POST", f"/sessions/{session['id']}/answers", dict(answer=answer)
+            )
+            grading_timings.append(time.perf_counter() - start)
+            session = result["session"]
+        await client.request("DELETE", f"/sessions/{session['id']}")
+    finally:
+        client.close()
+
+
+async def run_learners(port, learners, concurrency, story_id, common_rate):
+    grading_timings = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(number):
+        async with semaphore:
+            await run_learner(port, number, story_id, grading_timings, number < learners * common_rate)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run(number) for number in range(learners)])
+    return time.perf_counter() - start, sorted(grading_timings)
+
+
+def start_server():
+    server = KumpelServer(SERVER_WORKERS)
+    ready = threading.Event()
+    ports = []
+
+    def on_ready(port):
+        ports.append(port)
+        ready.set()
+
+    thread = threading.Thread(target=asyncio.run, args=(server.serve("127.0.0.1", 0, on_ready),), daemon=True)
+    thread.start()
+    ready.wait()
+    return ports[0]
+
+
+def main():
+    learners = int(sys.argv[1]) if len(sys.argv) > 1 else LEARNERS
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else CONCURRENCY
+    common_rate = float(sys.argv[3]) if len(sys.argv) > 3 else COMMON_ANSWER_RATE
+    os.environ.setdefault("KUMPEL_RATE_LIMITS", "off")
+    os.environ["KUMPEL_RESPONSE_CACHE"] = "off"
+    set_backend(FakeBackend(latency=LATENCY_SECONDS, seed=1))
+    db_fd, db_path = tempfile.mkstemp(suffix=".sqlite")
+    db.DB = db_path
+    try:
+        init_db()
+        sentences = [StorySentence(id=i + 1, german=german, english=english) for i, (german, english) in enumerate(FAKE_SENTENCES)]
+        content = Story(story_name="Ein Tag wie jeder andere", sentences=sentences)
+        story_id = save_story(dict(level="A1", topic=None, style=None, model="gemini-2.5-flash", content=content))
+        port = start_server()
+        elapsed, timings = asyncio.run(run_learners(port, learners, concurrency, story_id, common_rate))
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{learners} learners, {concurrency} at a time: {elapsed:.2f}s, {learners / elapsed:.2f} sessions/s")
+        print(f"Grading: p50 {statistics.median(timings) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms ({len(timings)} answers, {LATENCY_SECONDS * 1000:.0f} ms backend latency)")
+        print(f"Gemini calls: {len(call_log)}, {cache_stats['coalesced']} coalesced, {cache_stats['hits'] + cache_stats['incorrect_hits']} answer cache hits")
+    finally:
+        close_db()
+        os.close(db_fd)
+        for path in [db_path, db_path + "-wal", db_path + "-shm"]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
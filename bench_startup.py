@@ -0,0 +1,49 @@
+import re
+import sys
+import statistics
+import subprocess
+
+
+# Benchmark config
+RUNS = 5
+STARTUP_BUDGET_MS = 150
+DEFERRED_MODULES = ["google.genai", "pydantic", "httpx", "yaspin", "texttable"]
+
+
+def time_import():
+    # Returns the cumulative import time of main and the modules it loaded
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = re.fullmatch(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match:
+            modules[match.group(3)] = int(match.group(1))
+    return modules["main"] / 1000, modules
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else STARTUP_BUDGET_MS
+    timings = []
+    for _ in range(RUNS):
+        milliseconds, modules = time_import()
+        timings.append(milliseconds)
+    median = statistics.median(timings)
+    print(f"import main: p50 {median:.1f} ms, max {max(timings):.1f} ms ({RUNS} runs, budget {budget:.0f} ms)")
+    failed = False
+    loaded = [module for module in DEFERRED_MODULES if module in modules]
+    if loaded:
+        print(f"Loaded at startup, should be deferred: {', '.join(loaded)}")
+        failed = True
+    if median > budget:
+        print(f"Startup is over budget by {median - budget:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import sys
+import json
+import time
+import threading
+from types import SimpleNamespace
+from responsecache import get_request_key
+
+
+# Cassettes record Gemini requests and responses as JSON lines, e.g.
+# KUMPEL_CASSETTE=session.jsonl KUMPEL_CASSETTE_MODE=record
+USAGE_FIELDS = ["prompt_token_count", "cached_content_token_count", "candidates_token_count", "total_token_count"]
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+def get_cassette_key(model, config, contents):
+    # The response cache key, but context cache names change every run, so
+    # only whether a context cache was used counts.
+    config = config.model_copy(update=dict(cached_content=bool(config.cached_content)))
+    return get_request_key(model, config, contents)
+
+
+def dump_usage(usage):
+    return {field: getattr(usage, field, None) for field in USAGE_FIELDS}
+
+
+def load_usage(usage):
+    return SimpleNamespace(**usage) if usage else None
+
+
+class RecordingBackend:
+    # Passes requests on to another backend and appends every response to
+    # the cassette
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        self.lock = threading.Lock()
+
+    def write(self, entry):
+        with self.lock:
+            with open(self.path, "a") as cassette:
+                cassette.write(json.dumps(entry) + "\n")
+
+    def generate_content(self, model, config, contents):
+        start = time.perf_counter()
+        response = self.backend.generate_content(model, config, contents)
+        self.write(dict(
+            kind="response",
+            key=get_cassette_key(model, config, contents),
+            model=model,
+            seconds=time.perf_counter() - start,
+            text=response.text,
+            usage=dump_usage(response.usage_metadata),
+        ))
+        return response
+
+    def generate_content_stream(self, model, config, contents):
+        start = time.perf_counter()
+        chunks = []
+        usage = None
+        for chunk in self.backend.generate_content_stream(model, config, contents):
+            chunks.append(dict(seconds=time.perf_counter() - start, text=chunk.text or ""))
+            if chunk.usage_metadata:
+                usage = chunk.usage_metadata
+            yield chunk
+        self.write(dict(
+            kind="stream",
+            key=get_cassette_key(model, config, contents),
+            model=model,
+            seconds=time.perf_counter() - start,
+            chunks=chunks,
+            usage=dump_usage(usage),
+        ))
+
+    def create_cache(self, model, config):
+        return self.backend.create_cache(model, config)
+
+    def delete_cache(self, name):
+        self.backend.delete_cache(name)
+
+
+class ReplayBackend:
+    # Answers requests from a cassette without a network. Repeated requests
+    # get their recorded responses in order. With recorded_latency the
+    # responses take as long as they did when recorded.
+
+    def __init__(self, path, recorded_latency=False):
+        self.recorded_latency = recorded_latency
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.caches = 0
+        with open(path) as cassette:
+            for line in cassette:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries.setdefault((entry["kind"], entry["key"]), []).append(entry)
+
+    def take(self, kind, model, config, contents):
+        key = (kind, get_cassette_key(model, config, contents))
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recorded {model} {kind} for this request")
+            # The last recording answers any further repeats
+            return entries.pop(0) if len(entries) > 1 else entries[0]
+
+    def generate_content(self, model, config, contents):
+        entry = self.take("response", model, config, contents)
+        if self.recorded_latency:
+            time.sleep(entry["seconds"])
+        try:
+            parsed = config.response_schema.model_validate_json(entry["text"] or "")
+        except ValueError:
+            # Invalid responses replay as invalid
+            parsed = None
+        return SimpleNamespace(parsed=parsed, text=entry["text"], usage_metadata=load_usage(entry["usage"]))
+
+    def generate_content_stream(self, model, config, contents):
+        entry = self.take("stream", model, config, contents)
+        start = time.perf_counter()
+        for index, chunk in enumerate(entry["chunks"]):
+            if self.recorded_latency:
+                time.sleep(max(0.0, chunk["seconds"] - (time.perf_counter() - start)))
+            usage = load_usage(entry["usage"]) if index == len(entry["chunks"]) - 1 else None
+            yield SimpleNamespace(text=chunk["text"], usage_metadata=usage)
+
+    def create_cache(self, model, config):
+        with self.lock:
+            self.caches += 1
+            return f"cachedContents/replay-{self.caches}"
+
+    def delete_cache(self, name):
+        pass
+
+
+def summarize_cassette(path):
+    # Calls, time and tokens per model, to compare recordings of prompt changes
+    summary = {}
+    with open(path) as cassette:
+        for line in cassette:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            model_summary = summary.setdefault(entry["model"], dict(calls=0, seconds=0.0, prompt_tokens=0, response_tokens=0))
+            model_summary["calls"] += 1
+            model_summary["seconds"] += entry["seconds"]
+            model_summary["prompt_tokens"] += entry["usage"]["prompt_token_count"] or 0
+            model_summary["response_tokens"] += entry["usage"]["candidates_token_count"] or 0
+    return summary
+
+
+def main():
+    for path in sys.argv[1:]:
+        print(path)
+        for model, model_summary in summarize_cassette(path).items():
+            print(f"  {model}: {model_summary['calls']} calls, {model_summary['seconds']:.2f}s, {model_summary['prompt_tokens']} prompt tokens, {model_summary['response_tokens']} response tokens")
+
+
+if __name__ == "__main__":
+    main()
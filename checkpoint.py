@@ -0,0 +1,58 @@
+from db import add_session, update_session, add_session_progress, load_last_session, load_session_progress, load_story, load_references
+from pool import parse_story
+
+
+# Sessions are checkpointed to the database as they happen, so a session
+# interrupted by Ctrl-C or a crash can be resumed without any API calls.
+# Progress is stored as the indexes of passed sentences.
+
+
+def start_checkpoint(story):
+    # Saved stories are loaded from the story tables on resume, generated
+    # ones are kept with the session. A streamed story is kept once it has
+    # finished streaming.
+    content = None
+    if story["id"] is None and not story.get("stream"):
+        content = story["content"].model_dump_json()
+    story["session"] = add_session(story["id"], story["level"], story["topic"], story["style"], story["model"], content)
+
+
+def checkpoint_content(story):
+    update_session(story["session"], content=story["content"].model_dump_json())
+
+
+def checkpoint_mode(story, mode):
+    update_session(story["session"], mode=mode)
+
+
+def checkpoint_progress(story, index):
+    add_session_progress(story["session"], index)
+
+
+def finish_checkpoint(story):
+    update_session(story["session"], finished=1)
+
+
+def load_checkpoint():
+    # Returns the story of the last unfinished session with its mode and
+    # passed sentence indexes, or None
+    from schemas import parse_story_sentences
+    session = load_last_session()
+    if not session:
+        return None
+    if session["story_id"] is not None:
+        content = parse_story_sentences(session["name"], load_story(session["story_id"]), load_references(session["story_id"]))
+    else:
+        content = parse_story(session["content"])
+    return dict(
+        id=session["story_id"],
+        level=session["level"],
+        topic=session["topic"],
+        style=session["style"],
+        model=session["model"],
+        content=content,
+        stream=None,
+        session=session["id"],
+        mode=session["mode"],
+        passed=load_session_progress(session["id"]),
+    )
@@ -1,21 +1,51 @@
 import sqlite3
 import json
+import time
+import hashlib
+import threading
+from textnorm import normalize_answer
+from profiling import span
 
 
 DB = "story.sqlite"
 
 
+# Incorrect answer cache eviction
+INCORRECT_ANSWER_TTL_SECONDS = 30 * 24 * 60 * 60
+INCORRECT_ANSWERS_PER_SENTENCE = 20
+
+
 def dict_factory(cursor, row):
     fields = [column[0] for column in cursor.description]
     return {key: value for key, value in zip(fields, row)}
 
 
+# Long-lived connections, one per thread. sqlite3 keeps the prepared
+# statements of each connection in its statement cache.
+connections = threading.local()
+STATEMENT_CACHE_SIZE = 256
+
+
 def get_db():
-    db = sqlite3.connect(DB)
-    db.row_factory = dict_factory
+    db = getattr(connections, "db", None)
+    if db is None or connections.path != DB:
+        close_db()
+        db = sqlite3.connect(DB, cached_statements=STATEMENT_CACHE_SIZE)
+        db.row_factory = dict_factory
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        connections.db = db
+        connections.path = DB
     return db
 
 
+def close_db():
+    db = getattr(connections, "db", None)
+    if db is not None:
+        db.close()
+        connections.db = None
+
+
 def init_db():
     db = get_db()
     db.executescript("""
@@ -23,6 +53,18 @@ BEGIN;
 DROP TABLE IF EXISTS story;
 DROP TABLE IF EXISTS sentence;
 DROP TABLE IF EXISTS cache;
+DROP TABLE IF EXISTS answer;
+DROP TABLE IF EXISTS incorrect_answer;
+DROP TABLE IF EXISTS reference;
+DROP TABLE IF EXISTS rate_limit;
+DROP TABLE IF EXISTS story_pool;
+DROP TABLE IF EXISTS story_pool_stat;
+DROP TABLE IF EXISTS response_cache;
+DROP TABLE IF EXISTS llm_call;
+DROP TABLE IF EXISTS session;
+DROP TABLE IF EXISTS session_progress;
+DROP TABLE IF EXISTS story_sentence;
+DROP TABLE IF EXISTS story_search;
 CREATE TABLE story (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
@@ -44,25 +86,316 @@ CREATE TABLE answer (
     content TEXT NOT NULL,
     FOREIGN KEY (sentence_id)REFERENCES sentence (id)
 );
+PRAGMA user_version = 0;
 COMMIT;
     """)
-    db.close()
+    upgrade_db()
+
+
+def add_normalized_answers(db):
+    db.create_function("normalize_answer", 1, normalize_answer)
+    return """
+ALTER TABLE answer ADD COLUMN normalized TEXT;
+UPDATE answer SET normalized = normalize_answer(content);
+    """
+
+
+def add_incorrect_answers(db):
+    return """
+CREATE TABLE incorrect_answer (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sentence_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    feedback TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    FOREIGN KEY (sentence_id) REFERENCES sentence (id)
+);
+    """
+
+
+def add_references(db):
+    return """
+CREATE TABLE reference (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sentence_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    content TEXT NOT NULL,
+    FOREIGN KEY (sentence_id) REFERENCES sentence (id)
+);
+    """
+
+
+def add_indexes(db):
+    return """
+CREATE INDEX IF NOT EXISTS sentence_story_id ON sentence (story_id);
+CREATE INDEX IF NOT EXISTS answer_sentence_normalized ON answer (sentence_id, normalized);
+CREATE INDEX IF NOT EXISTS incorrect_answer_sentence_normalized ON incorrect_answer (sentence_id, normalized);
+CREATE INDEX IF NOT EXISTS incorrect_answer_created_at ON incorrect_answer (created_at);
+CREATE INDEX IF NOT EXISTS reference_sentence_id ON reference (sentence_id);
+    """
+
+
+def add_rate_limits(db):
+    return """
+CREATE TABLE rate_limit (
+    model TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+    """
 
 
-def load_stories():
+def add_story_pool(db):
+    return """
+CREATE TABLE story_pool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    level TEXT NOT NULL,
+    topic TEXT,
+    style TEXT,
+    model TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX story_pool_key ON story_pool (level, topic, style, model);
+CREATE TABLE story_pool_stat (
+    level TEXT NOT NULL,
+    topic TEXT,
+    style TEXT,
+    model TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX story_pool_stat_key ON story_pool_stat (level, ifnull(topic, ''), ifnull(style, ''), model);
+    """
+
+
+def add_response_cache(db):
+    return """
+CREATE TABLE response_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX response_cache_used_at ON response_cache (used_at);
+    """
+
+
+def add_llm_calls(db):
+    return """
+CREATE TABLE llm_call (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    purpose TEXT,
+    mode TEXT,
+    sentences INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    response_tokens INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    wait_seconds REAL NOT NULL DEFAULT 0,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    created_at INTEGER NOT NULL
+);
+    """
+
+
+def add_sessions(db):
+    return """
+CREATE TABLE session (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    story_id INTEGER,
+    level TEXT NOT NULL,
+    topic TEXT,
+    style TEXT,
+    model TEXT NOT NULL,
+    content TEXT,
+    mode TEXT,
+    finished INTEGER NOT NULL DEFAULT 0,
+    created_at INTEGER NOT NULL,
+    FOREIGN KEY (story_id) REFERENCES story (id)
+);
+CREATE TABLE session_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL,
+    sentence_index INTEGER NOT NULL,
+    FOREIGN KEY (session_id) REFERENCES session (id)
+);
+CREATE INDEX session_progress_session_id ON session_progress (session_id);
+    """
+
+
+def share_sentences(db):
+    # Folds sentences with the same German and English together, so their
+    # answers are shared by every story which contains them. Stories list
+    # their sentences in story_sentence instead. Answers and references of
+    # sentences which were never saved, e.g. answers to unsaved stories
+    # keyed by the model's sentence ids, cannot be mapped and are dropped.
+    db.create_function("get_sentence_hash", 2, get_sentence_hash)
+    return """
+ALTER TABLE sentence ADD COLUMN hash TEXT;
+UPDATE sentence SET hash = get_sentence_hash(de, en);
+CREATE TEMP TABLE sentence_merge AS
+    SELECT sentence.id AS old_id, canonical.id AS new_id FROM sentence
+    JOIN (SELECT hash, min(id) AS id FROM sentence GROUP BY hash) AS canonical ON canonical.hash = sentence.hash;
+CREATE TABLE story_sentence (
+    story_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    sentence_id INTEGER NOT NULL,
+    PRIMARY KEY (story_id, position),
+    FOREIGN KEY (story_id) REFERENCES story (id),
+    FOREIGN KEY (sentence_id) REFERENCES sentence (id)
+);
+INSERT INTO story_sentence (story_id, position, sentence_id)
+    SELECT sentence.story_id, row_number() OVER (PARTITION BY sentence.story_id ORDER BY sentence.id) - 1, sentence_merge.new_id
+    FROM sentence JOIN sentence_merge ON sentence_merge.old_id = sentence.id;
+CREATE INDEX story_sentence_sentence_id ON story_sentence (sentence_id);
+DELETE FROM answer WHERE sentence_id NOT IN (SELECT old_id FROM sentence_merge);
+DELETE FROM incorrect_answer WHERE sentence_id NOT IN (SELECT old_id FROM sentence_merge);
+DELETE FROM reference WHERE sentence_id NOT IN (SELECT old_id FROM sentence_merge);
+UPDATE answer SET sentence_id = (SELECT new_id FROM sentence_merge WHERE old_id = answer.sentence_id);
+UPDATE incorrect_answer SET sentence_id = (SELECT new_id FROM sentence_merge WHERE old_id = incorrect_answer.sentence_id);
+UPDATE reference SET sentence_id = (SELECT new_id FROM sentence_merge WHERE old_id = reference.sentence_id);
+DELETE FROM answer WHERE id NOT IN (SELECT min(id) FROM answer GROUP BY sentence_id, normalized);
+DELETE FROM reference WHERE id NOT IN (SELECT min(id) FROM reference GROUP BY sentence_id, kind, content);
+CREATE UNIQUE INDEX reference_sentence_kind_content ON reference (sentence_id, kind, content);
+CREATE TABLE shared_sentence (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash TEXT NOT NULL,
+    de TEXT NOT NULL,
+    en TEXT NOT NULL
+);
+INSERT INTO shared_sentence (id, hash, de, en)
+    SELECT id, hash, de, en FROM sentence WHERE id IN (SELECT new_id FROM sentence_merge);
+DROP TABLE sentence;
+ALTER TABLE shared_sentence RENAME TO sentence;
+CREATE UNIQUE INDEX sentence_hash ON sentence (hash);
+DROP TABLE sentence_merge;
+    """
+
+
+def add_story_search(db):
+    # story_search is an FTS5 index of story names and sentences, with the
+    # story id as its rowid
+    return """
+CREATE INDEX story_level_model ON story (level, model);
+CREATE INDEX story_model ON story (model);
+CREATE VIRTUAL TABLE story_search USING fts5 (name, sentences, tokenize = 'unicode61 remove_diacritics 2');
+INSERT INTO story_search (rowid, name, sentences)
+    SELECT story.id, story.name, (
+        SELECT group_concat(sentence.de || ' ' || sentence.en, ' ') FROM story_sentence
+        JOIN sentence ON sentence.id = story_sentence.sentence_id
+        WHERE story_sentence.story_id = story.id
+    ) FROM story;
+    """
+
+
+def renormalize_answers(db):
+    # 'd is no longer expanded to "would", which was wrong for "had"
+    db.create_function("normalize_answer", 1, normalize_answer)
+    return """
+UPDATE answer SET normalized = normalize_answer(content);
+UPDATE incorrect_answer SET normalized = normalize_answer(content);
+    """
+
+
+# Schema migrations in order. Each returns its SQL script, which is run in
+# one transaction with the user_version bump. PRAGMA user_version counts
+# those applied.
+MIGRATIONS = [
+    add_normalized_answers,
+    add_incorrect_answers,
+    add_references,
+    add_indexes,
+    add_rate_limits,
+    add_story_pool,
+    add_response_cache,
+    add_llm_calls,
+    add_sessions,
+    share_sentences,
+    add_story_search,
+    renormalize_answers,
+]
+
+
+def upgrade_db():
     db = get_db()
-    stories = db.execute("SELECT id, name, level, topic, style, model FROM story").fetchall()
-    db.close()
+    version = db.execute("PRAGMA user_version").fetchone()["user_version"]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        script = migration(db)
+        try:
+            db.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except sqlite3.Error:
+            # Leaves nothing of a failed migration behind
+            db.rollback()
+            raise
+
+
+def has_stories():
+    db = get_db()
+    return db.execute("SELECT id FROM story LIMIT 1").fetchone() is not None
+
+
+def find_story(story_id):
+    db = get_db()
+    story = db.execute("SELECT id, name, level, topic, style, model FROM story WHERE id = ?", (story_id,)).fetchone()
+    return story
+
+
+def get_search_query(text):
+    # Every word has to match the start of a word in the story name or its
+    # sentences, e.g. "hund kaff" finds "Der Hund trinkt Kaffee."
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+def load_story_page(after_id=0, limit=10, level=None, model=None, search=None):
+    # Keyset paging: the next page starts after the last story id shown
+    db = get_db()
+    conditions = ["id > :after_id"]
+    if level:
+        conditions.append("level = :level")
+    if model:
+        conditions.append("model = :model")
+    if search and search.split():
+        conditions.append("id IN (SELECT rowid FROM story_search WHERE story_search MATCH :search)")
+        search = get_search_query(search)
+    stories = db.execute(
+        "SELECT id, name, level, topic, style, model FROM story"
+        f" WHERE {' AND '.join(conditions)}"
+        " ORDER BY id LIMIT :limit",
+        dict(after_id=after_id, limit=limit, level=level, model=model, search=search)
+    ).fetchall()
     return stories
 
 
 def load_story(story_id):
     db = get_db()
-    sentences = db.execute("SELECT id, de, en FROM sentence WHERE story_id = ?", (story_id,)).fetchall()
-    db.close()
+    sentences = db.execute(
+        "SELECT sentence.id, sentence.de, sentence.en FROM story_sentence"
+        " JOIN sentence ON sentence.id = story_sentence.sentence_id"
+        " WHERE story_sentence.story_id = ?"
+        " ORDER BY story_sentence.position",
+        (story_id,)
+    ).fetchall()
     return sentences
 
 
+def load_references(story_id):
+    db = get_db()
+    references = db.execute(
+        "SELECT sentence_id, kind, content FROM reference"
+        " WHERE sentence_id IN (SELECT sentence_id FROM story_sentence WHERE story_id = ?)"
+        " ORDER BY id",
+        (story_id,)
+    ).fetchall()
+    return references
+
+
 def save_story(story):
     story_name = story["content"].story_name
     db = get_db()
@@ -74,31 +407,294 @@ def save_story(story):
     )
     story_id = cur.lastrowid
     story_sentences = story["content"].sentences
-    content = []
-    for sentence in story_sentences:
-        content.append([story_id, sentence.german, sentence.english])
+    references = []
+    for position, sentence in enumerate(story_sentences):
+        sentence_id = insert_sentence(db, sentence.german, sentence.english)
+        cur.execute(
+            "INSERT INTO story_sentence (story_id, position, sentence_id)"
+            " VALUES (?, ?, ?)",
+            (story_id, position, sentence_id)
+        )
+        for paraphrase in getattr(sentence, "paraphrases", []):
+            references.append([sentence_id, "paraphrase", paraphrase])
+        for lemma in getattr(sentence, "lemmas", []):
+            references.append([sentence_id, "lemma", lemma])
     cur.executemany(
-        "INSERT INTO sentence (story_id, de, en)"
+        "INSERT OR IGNORE INTO reference (sentence_id, kind, content)"
         " VALUES (?, ?, ?)",
-        content
+        references
+    )
+    cur.execute(
+        "INSERT INTO story_search (rowid, name, sentences) VALUES (?, ?, ?)",
+        (story_id, story_name, " ".join(f"{sentence.german} {sentence.english}" for sentence in story_sentences))
     )
     db.commit()
-    db.close()
+    return story_id
+
 
+def get_sentence_hash(de, en):
+    return hashlib.sha256(json.dumps([de, en]).encode()).hexdigest()
 
+
+def insert_sentence(db, de, en):
+    # Returns the id of the sentence, which is shared by every story
+    # containing it
+    sentence_hash = get_sentence_hash(de, en)
+    db.execute(
+        "INSERT OR IGNORE INTO sentence (hash, de, en) VALUES (?, ?, ?)",
+        (sentence_hash, de, en)
+    )
+    sentence = db.execute("SELECT id FROM sentence WHERE hash = ?", (sentence_hash,)).fetchone()
+    return sentence["id"]
+
+
+def save_sentence(de, en):
+    db = get_db()
+    sentence_id = insert_sentence(db, de, en)
+    db.commit()
+    return sentence_id
+
+
+@span("save_answer")
 def save_answer(sentence_id, answer):
+    normalized = normalize_answer(answer)
     db = get_db()
-    db.execute("INSERT INTO answer (sentence_id, content) VALUES (?, ?)", (sentence_id, answer))
+    db.execute(
+        "INSERT INTO answer (sentence_id, content, normalized) VALUES (?, ?, ?)",
+        (sentence_id, answer, normalized)
+    )
+    db.execute(
+        "DELETE FROM incorrect_answer WHERE sentence_id = ? AND normalized = ?",
+        (sentence_id, normalized)
+    )
     db.commit()
-    db.close()
 
 
+@span("check_cache")
 def check_cache(sentence_id, answer):
     db = get_db()
     answers = db.execute(
         "SELECT id FROM answer"
-        " WHERE sentence_id = ? AND content = ?",
-        (sentence_id, answer)
+        " WHERE sentence_id = ? AND normalized = ?",
+        (sentence_id, normalize_answer(answer))
     ).fetchone()
-    db.close()
     return answers
+
+
+def load_answers(sentence_id):
+    db = get_db()
+    answers = db.execute("SELECT content FROM answer WHERE sentence_id = ?", (sentence_id,)).fetchall()
+    return [answer["content"] for answer in answers]
+
+
+def save_incorrect_answer(sentence_id, answer, feedback):
+    now = int(time.time())
+    db = get_db()
+    db.execute(
+        "INSERT INTO incorrect_answer (sentence_id, content, normalized, feedback, created_at)"
+        " VALUES (?, ?, ?, ?, ?)",
+        (sentence_id, answer, normalize_answer(answer), feedback, now)
+    )
+    # Evict expired feedback and keep only the newest answers for the sentence
+    db.execute(
+        "DELETE FROM incorrect_answer WHERE created_at < ?",
+        (now - INCORRECT_ANSWER_TTL_SECONDS,)
+    )
+    db.execute(
+        "DELETE FROM incorrect_answer WHERE sentence_id = ? AND id NOT IN"
+        " (SELECT id FROM incorrect_answer WHERE sentence_id = ? ORDER BY id DESC LIMIT ?)",
+        (sentence_id, sentence_id, INCORRECT_ANSWERS_PER_SENTENCE)
+    )
+    db.commit()
+
+
+def check_incorrect_cache(sentence_id, answer):
+    db = get_db()
+    incorrect_answer = db.execute(
+        "SELECT feedback FROM incorrect_answer"
+        " WHERE sentence_id = ? AND normalized = ? AND created_at >= ?"
+        " ORDER BY id DESC",
+        (sentence_id, normalize_answer(answer), int(time.time()) - INCORRECT_ANSWER_TTL_SECONDS)
+    ).fetchone()
+    return incorrect_answer
+
+
+def load_rate_limits():
+    db = get_db()
+    rate_limits = db.execute("SELECT model, requests, tokens, updated_at FROM rate_limit").fetchall()
+    return rate_limits
+
+
+def save_rate_limit(model, requests, tokens, updated_at):
+    db = get_db()
+    db.execute(
+        "INSERT OR REPLACE INTO rate_limit (model, requests, tokens, updated_at)"
+        " VALUES (?, ?, ?, ?)",
+        (model, requests, tokens, updated_at)
+    )
+    db.commit()
+
+
+def add_pool_story(level, topic, style, model, content):
+    db = get_db()
+    db.execute(
+        "INSERT INTO story_pool (level, topic, style, model, content, created_at)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        (level, topic, style, model, content, int(time.time()))
+    )
+    db.commit()
+
+
+def take_pool_story(level, topic, style, model):
+    db = get_db()
+    db.execute("BEGIN IMMEDIATE")
+    pool_story = db.execute(
+        "SELECT id, content FROM story_pool"
+        " WHERE level = ? AND topic IS ? AND style IS ? AND model = ?"
+        " ORDER BY id LIMIT 1",
+        (level, topic, style, model)
+    ).fetchone()
+    if pool_story:
+        db.execute("DELETE FROM story_pool WHERE id = ?", (pool_story["id"],))
+    db.commit()
+    return pool_story
+
+
+def count_pool_stories(level, topic, style, model):
+    db = get_db()
+    count = db.execute(
+        "SELECT count(*) AS count FROM story_pool"
+        " WHERE level = ? AND topic IS ? AND style IS ? AND model = ?",
+        (level, topic, style, model)
+    ).fetchone()
+    return count["count"]
+
+
+def record_pool_result(level, topic, style, model, hit):
+    db = get_db()
+    db.execute(
+        "INSERT INTO story_pool_stat (level, topic, style, model, hits, misses)"
+        " VALUES (?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT (level, ifnull(topic, ''), ifnull(style, ''), model)"
+        " DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+        (level, topic, style, model, int(hit), int(not hit))
+    )
+    db.commit()
+
+
+def load_pool_stats():
+    db = get_db()
+    pool_stats = db.execute(
+        "SELECT story_pool_stat.level, story_pool_stat.topic, story_pool_stat.style, story_pool_stat.model,"
+        " story_pool_stat.hits, story_pool_stat.misses,"
+        " (SELECT count(*) FROM story_pool WHERE story_pool.level = story_pool_stat.level"
+        " AND story_pool.topic IS story_pool_stat.topic AND story_pool.style IS story_pool_stat.style"
+        " AND story_pool.model = story_pool_stat.model) AS ready"
+        " FROM story_pool_stat"
+    ).fetchall()
+    return pool_stats
+
+
+def load_response(key, ttl_seconds):
+    db = get_db()
+    response = db.execute(
+        "SELECT content FROM response_cache WHERE key = ? AND created_at >= ?",
+        (key, int(time.time()) - ttl_seconds)
+    ).fetchone()
+    if response:
+        db.execute("UPDATE response_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+        db.commit()
+    return response
+
+
+def save_response(key, model, content, ttl_seconds, size):
+    now = time.time()
+    db = get_db()
+    db.execute(
+        "INSERT OR REPLACE INTO response_cache (key, model, content, created_at, used_at)"
+        " VALUES (?, ?, ?, ?, ?)",
+        (key, model, content, int(now), now)
+    )
+    # Evict expired responses and keep only the most recently used ones
+    db.execute("DELETE FROM response_cache WHERE created_at < ?", (int(now) - ttl_seconds,))
+    db.execute(
+        "DELETE FROM response_cache WHERE key NOT IN"
+        " (SELECT key FROM response_cache ORDER BY used_at DESC LIMIT ?)",
+        (size,)
+    )
+    db.commit()
+
+
+def save_llm_call(call):
+    db = get_db()
+    db.execute(
+        "INSERT INTO llm_call (model, purpose, mode, sentences, prompt_tokens, cached_tokens, response_tokens,"
+        " seconds, retries, wait_seconds, cache_hit, cost, created_at)"
+        " VALUES (:model, :purpose, :mode, :sentences, :prompt_tokens, :cached_tokens, :response_tokens,"
+        " :seconds, :retries, :wait_seconds, :cache_hit, :cost, :created_at)",
+        dict(call, created_at=int(time.time()))
+    )
+    db.commit()
+
+
+def load_llm_calls():
+    db = get_db()
+    llm_calls = db.execute(
+        "SELECT model, purpose, mode, sentences, prompt_tokens, cached_tokens, response_tokens,"
+        " seconds, retries, wait_seconds, cache_hit, cost FROM llm_call"
+    ).fetchall()
+    return llm_calls
+
+
+def add_session(story_id, level, topic, style, model, content):
+    # Only the last session can be resumed, so starting a new one replaces
+    # the earlier sessions, finished or not
+    db = get_db()
+    db.execute("DELETE FROM session_progress")
+    db.execute("DELETE FROM session")
+    cur = db.execute(
+        "INSERT INTO session (story_id, level, topic, style, model, content, created_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (story_id, level, topic, style, model, content, int(time.time()))
+    )
+    db.commit()
+    return cur.lastrowid
+
+
+def update_session(session_id, **fields):
+    # e.g. update_session(1, mode="test") or update_session(1, finished=1)
+    db = get_db()
+    assignments = ", ".join(f"{field} = :{field}" for field in fields)
+    db.execute(f"UPDATE session SET {assignments} WHERE id = :id", dict(fields, id=session_id))
+    db.commit()
+
+
+def add_session_progress(session_id, sentence_index):
+    db = get_db()
+    db.execute(
+        "INSERT INTO session_progress (session_id, sentence_index) VALUES (?, ?)",
+        (session_id, sentence_index)
+    )
+    db.commit()
+
+
+def load_last_session():
+    # The latest unfinished session whose story can be restored
+    db = get_db()
+    session = db.execute(
+        "SELECT session.id, session.story_id, story.name, session.level, session.topic, session.style,"
+        " session.model, session.content, session.mode FROM session"
+        " LEFT JOIN story ON story.id = session.story_id"
+        " WHERE session.finished = 0 AND (session.story_id IS NOT NULL OR session.content IS NOT NULL)"
+        " ORDER BY session.id DESC LIMIT 1"
+    ).fetchone()
+    return session
+
+
+def load_session_progress(session_id):
+    db = get_db()
+    progress = db.execute(
+        "SELECT sentence_index FROM session_progress WHERE session_id = ? ORDER BY id",
+        (session_id,)
+    ).fetchall()
+    return [row["sentence_index"] for row in progress]
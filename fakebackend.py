@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import time
+import random
+from types import SimpleNamespace
+
+
+# Fake backend config, read by FakeBackend.from_env() when KUMPEL_BACKEND=fake
+DEFAULT_LATENCY_SECONDS = 0.5
+DEFAULT_ERROR_CODES = [429, 500, 503, 504]
+DEFAULT_RETRY_DELAY_SECONDS = 1
+DEFAULT_STORY_SENTENCES = 8
+DEFAULT_CORRECT_RATE = 0.8
+STREAM_CHUNK_CHARACTERS = 64
+
+
+# Sentences the fake stories are made of
+FAKE_SENTENCES = [
+    ("Der Hund läuft nach Hause.", "The dog runs home."),
+    ("Die Sonne scheint heute.", "The sun is shining today."),
+    ("Ich trinke gern Kaffee.", "I like to drink coffee."),
+    ("Wir gehen morgen ins Kino.", "We are going to the cinema tomorrow."),
+    ("Das Buch liegt auf dem Tisch.", "The book is on the table."),
+    ("Meine Schwester wohnt in Berlin.", "My sister lives in Berlin."),
+    ("Es regnet seit gestern.", "It has been raining since yesterday."),
+    ("Der Zug kommt um acht Uhr an.", "The train arrives at eight o'clock."),
+]
+
+
+class FakeAPIError(Exception):
+    # Looks like a google.genai APIError to the retry logic in llm.py
+
+    def __init__(self, code, retry_delay):
+        super().__init__(f"{code} Fake backend error")
+        self.code = code
+        self.details = {"error": {"code": code, "details": [{"retryDelay": f"{retry_delay}s"}]}}
+
+
+class FakeBackend:
+    # Stands in for Gemini without a network. Responses are valid for the
+    # request's schema, and latency, errors and invalid responses can be
+    # injected to exercise the retry and rate limiting code.
+
+    def __init__(self, latency=DEFAULT_LATENCY_SECONDS, error_rate=0.0, error_codes=DEFAULT_ERROR_CODES,
+                 invalid_rate=0.0, retry_delay=DEFAULT_RETRY_DELAY_SECONDS, story_sentences=DEFAULT_STORY_SENTENCES,
+                 correct_rate=DEFAULT_CORRECT_RATE, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.invalid_rate = invalid_rate
+        self.retry_delay = retry_delay
+        self.story_sentences = story_sentences
+        self.correct_rate = correct_rate
+        self.random = random.Random(seed)
+        self.caches = set()
+
+    @classmethod
+    def from_env(cls):
+        error_codes = os.environ.get("KUMPEL_FAKE_ERROR_CODES")
+        seed = os.environ.get("KUMPEL_FAKE_SEED")
+        return cls(
+            latency=float(os.environ.get("KUMPEL_FAKE_LATENCY", DEFAULT_LATENCY_SECONDS)),
+            error_rate=float(os.environ.get("KUMPEL_FAKE_ERROR_RATE", 0.0)),
+            error_codes=[int(code) for code in error_codes.split(",")] if error_codes else DEFAULT_ERROR_CODES,
+            invalid_rate=float(os.environ.get("KUMPEL_FAKE_INVALID_RATE", 0.0)),
+            retry_delay=float(os.environ.get("KUMPEL_FAKE_RETRY_DELAY", DEFAULT_RETRY_DELAY_SECONDS)),
+            story_sentences=int(os.environ.get("KUMPEL_FAKE_STORY_SENTENCES", DEFAULT_STORY_SENTENCES)),
+            correct_rate=float(os.environ.get("KUMPEL_FAKE_CORRECT_RATE", DEFAULT_CORRECT_RATE)),
+            seed=int(seed) if seed else None,
+        )
+
+    def generate_content(self, model, config, contents):
+        time.sleep(self.latency)
+        self.maybe_fail()
+        return self.get_response(config, contents)
+
+    def generate_content_stream(self, model, config, contents):
+        self.maybe_fail()
+        response = self.get_response(config, contents)
+        chunks = [response.text[i:i + STREAM_CHUNK_CHARACTERS] for i in range(0, len(response.text), STREAM_CHUNK_CHARACTERS)]
+        for index, chunk in enumerate(chunks):
+            time.sleep(self.latency / len(chunks))
+            usage = response.usage_metadata if index == len(chunks) - 1 else None
+            yield SimpleNamespace(text=chunk, usage_metadata=usage)
+
+    def create_cache(self, model, config):
+        name = f"cachedContents/fake-{len(self.caches) + 1}"
+        self.caches.add(name)
+        return name
+
+    def delete_cache(self, name):
+        self.caches.discard(name)
+
+    def maybe_fail(self):
+        if self.random.random() < self.error_rate:
+            raise FakeAPIError(self.random.choice(self.error_codes), self.retry_delay)
+
+    def get_response(self, config, contents):
+        schema = config.response_schema
+        if self.random.random() < self.invalid_rate:
+            parsed = None
+            text = "{}"
+        else:
+            parsed = schema.model_validate(self.get_content(schema, str(contents)))
+            text = parsed.model_dump_json()
+        usage = SimpleNamespace(
+            prompt_token_count=len(str(contents)) // 4 + 1,
+            cached_content_token_count=0,
+            candidates_token_count=len(text) // 4 + 1,
+        )
+        usage.total_token_count = usage.prompt_token_count + usage.candidates_token_count
+        return SimpleNamespace(parsed=parsed, text=text, usage_metadata=usage)
+
+    def get_content(self, schema, contents):
+        fields = schema.model_fields
+        if "story_name" in fields:
+            return self.get_story(schema)
+        if "results" in fields:
+            count = len(re.findall(r"^\d+\. Sentence:", contents, re.MULTILINE))
+            return dict(results=[dict(index=index, **self.get_feedback()) for index in range(count)])
+        feedback = self.get_feedback()
+        if "confidence" in fields:
+            feedback["confidence"] = self.random.random()
+        return feedback
+
+    def get_story(self, schema):
+        with_references = "paraphrases" in json.dumps(schema.model_json_schema())
+        sentences = []
+        for index in range(self.story_sentences):
+            german, english = FAKE_SENTENCES[index % len(FAKE_SENTENCES)]
+            sentence = dict(id=index + 1, german=german, english=english)
+            if with_references:
+                sentence["paraphrases"] = []
+                sentence["lemmas"] = []
+            sentences.append(sentence)
+        return dict(story_name="Ein Tag wie jeder andere", sentences=sentences)
+
+    def get_feedback(self):
+        if self.random.random() < self.correct_rate:
+            return dict(correct=True, feedback="")
+        return dict(correct=False, feedback="Have another look at the verb.")
@@ -0,0 +1,69 @@
+import os
+import time
+from llm import MAX_RETRIES, INITIAL_DELAY_SECONDS
+from responsecache import get_parsed_response
+
+
+# Story generation system instruction
+STORY_SYSTEM_INSTRUCTION = "You are a German storyteller. Your purpose is to provide a story which will help the user learn German."
+
+
+# Story generation instruction for reference translations
+REFERENCE_SYSTEM_INSTRUCTION = """
+For each sentence also provide up to 4 paraphrases: other English translations which are equally correct.
+Also provide the key English lemmas (base forms of the important words) which every correct translation must contain."""
+
+
+def get_story_request(level, topic, style):
+    from google.genai import types
+    from schemas import Story, ReferenceStory
+    system_instruction = STORY_SYSTEM_INSTRUCTION
+    response_schema = Story
+    if os.environ.get("KUMPEL_REFERENCE_TRANSLATIONS"):
+        system_instruction += REFERENCE_SYSTEM_INSTRUCTION
+        response_schema = ReferenceStory
+    config = types.GenerateContentConfig(
+        system_instruction=system_instruction,
+        response_mime_type="application/json",
+        response_schema=response_schema,
+    )
+    contents = get_story_prompt_contents(level, topic, style)
+    return config, contents
+
+
+def get_story_prompt_contents(level, topic, style):
+    contents = f"My current German level is: {level}. Provide me with a story to help me learn German."
+    if topic:
+        contents += f"\nI want the story to be about this topic/theme: {topic}"
+    if style:
+        contents += f"\nI want the story to be written in this style/genre: {style}"
+    return contents
+
+
+def request_story(level, topic, style, model, write=print, cancelled=None, cache=False):
+    # Returns None if Gemini keeps giving invalid responses or the request is
+    # cancelled before it is sent. Stories skip the response cache unless
+    # cache is set, so asking again gives a new story.
+    config, contents = get_story_request(level, topic, style)
+    validated = False
+    retry_count = 0
+    delay = INITIAL_DELAY_SECONDS
+    while not validated and retry_count < MAX_RETRIES:
+        if cancelled and cancelled.is_set():
+            return None
+        story = get_parsed_response(model, config, contents, cache, retry_count > 0, "generate", write=write)
+        if isinstance(story, config.response_schema):
+            validated = True
+        else:
+            retry_count += 1
+            if retry_count < MAX_RETRIES:
+                write(f"The Gemini response is invalid. Retrying in {delay} seconds... (Attempt {retry_count}/{MAX_RETRIES})")
+                time.sleep(delay)
+                delay *= 2
+            else:
+                write(f"The Gemini response is invalid. Maximum retries reached.")
+
+    if not validated:
+        return None
+
+    return story
@@ -0,0 +1,374 @@
+import os
+import sys
+import time
+import threading
+from concurrent.futures import Future
+from db import check_cache, load_answers, check_incorrect_cache, save_answer, save_incorrect_answer
+from textnorm import normalize_answer, answer_similarity, lemmas_covered
+from llm import MAX_RETRIES, INITIAL_DELAY_SECONDS, create_cache, using_cassette
+from responsecache import get_parsed_response
+from profiling import span
+
+
+# Story context config
+# "window" sends neighbouring sentences with each answer check, "cache" uploads
+# the story once per session as a Gemini context cache, "full" sends the
+# whole story every time.
+STORY_CONTEXT_MODES = ["window", "cache", "full"]
+DEFAULT_STORY_CONTEXT = "window"
+DEFAULT_CONTEXT_WINDOW = 2
+STORY_CACHE_TTL_SECONDS = 3600
+
+
+# Answer checking system instruction
+GRADING_SYSTEM_INSTRUCTION = """
+You are a German tutor. Your purpose is to check the user's translation of a sentence.
+Provide friendly feedback in English (max 25 words) if the translation is incorrect.
+Do not provide direct translations in the feedback."""
+
+
+# Grading cascade config
+# With KUMPEL_GRADING_CASCADE=1 answers are checked with Flash-Lite first and
+# only sent to the story's model when Flash-Lite is not confident enough.
+CASCADE_MODEL = "gemini-2.5-flash-lite"
+DEFAULT_CASCADE_THRESHOLD = 0.8
+
+
+# Grading cascade instruction for the confidence score
+CASCADE_SYSTEM_INSTRUCTION = """
+Also rate your confidence that your verdict is right as a number from 0 (guessing) to 1 (certain)."""
+
+
+# Grading cascade counters
+cascade_stats = dict(graded=0, escalations=0, cascade_seconds=0.0, escalation_seconds=0.0)
+
+
+# Answer cache counters
+cache_stats = dict(local_hits=0, hits=0, fuzzy_hits=0, incorrect_hits=0, misses=0, coalesced=0)
+
+
+# Answers are graded on worker threads too, so counters are updated under a lock
+stats_lock = threading.Lock()
+
+
+# Answer checks in progress, keyed by sentence id and normalised answer
+in_flight = {}
+in_flight_lock = threading.Lock()
+
+
+# Local grading config
+REFERENCE_SIMILARITY_THRESHOLD = 0.9
+
+
+def add_stat(stats, key, amount=1):
+    with stats_lock:
+        stats[key] += amount
+
+
+def get_fuzzy_threshold():
+    # Similarity lookup is opt-in, e.g. KUMPEL_FUZZY_THRESHOLD=0.9
+    threshold = os.environ.get("KUMPEL_FUZZY_THRESHOLD")
+    return float(threshold) if threshold else None
+
+
+def grade_locally(sentence, answer):
+    # Accepts answers matching the reference translations generated with the
+    # story. Anything unclear is left for the LLM.
+    references = [sentence.english] + getattr(sentence, "paraphrases", [])
+    normalized = normalize_answer(answer)
+    if any(normalized == normalize_answer(reference) for reference in references):
+        return True
+    lemmas = getattr(sentence, "lemmas", [])
+    if not lemmas or not lemmas_covered(answer, lemmas):
+        return False
+    return any(answer_similarity(answer, reference) >= REFERENCE_SIMILARITY_THRESHOLD for reference in references)
+
+
+def lookup_answer(sentence, answer):
+    # Returns cached Feedback, or None if the answer needs an LLM check
+    from schemas import Feedback
+    if grade_locally(sentence, answer):
+        add_stat(cache_stats, "local_hits")
+        return Feedback(correct=True, feedback="")
+    if using_cassette():
+        add_stat(cache_stats, "misses")
+        return None
+    if check_cache(sentence.id, answer):
+        add_stat(cache_stats, "hits")
+        return Feedback(correct=True, feedback="")
+    threshold = get_fuzzy_threshold()
+    if threshold:
+        accepted_answers = [sentence.english] + load_answers(sentence.id)
+        if any(answer_similarity(answer, accepted) >= threshold for accepted in accepted_answers):
+            add_stat(cache_stats, "fuzzy_hits")
+            return Feedback(correct=True, feedback="")
+    incorrect_answer = check_incorrect_cache(sentence.id, answer)
+    if incorrect_answer:
+        add_stat(cache_stats, "incorrect_hits")
+        return Feedback(correct=False, feedback=incorrect_answer["feedback"])
+    add_stat(cache_stats, "misses")
+    return None
+
+
+def get_story_context(story, session_mode=None):
+    # session_mode (learn, practice or test) is recorded with every call
+    mode = os.environ.get("KUMPEL_STORY_CONTEXT", DEFAULT_STORY_CONTEXT)
+    if mode not in STORY_CONTEXT_MODES:
+        raise ValueError(f"KUMPEL_STORY_CONTEXT must be one of: {', '.join(STORY_CONTEXT_MODES)}")
+    window = int(os.environ.get("KUMPEL_CONTEXT_WINDOW", DEFAULT_CONTEXT_WINDOW))
+    if mode != "window" and story.get("stream"):
+        # The whole story is needed, so wait for it to finish streaming
+        story["stream"].wait()
+    # A streamed story's sentence list keeps growing while the session runs
+    story_context = dict(mode=mode, sentences=story["content"].sentences, window=window, cache=None, session_mode=session_mode)
+    if mode == "cache":
+        german_story_string = " ".join(sentence.german for sentence in story["content"].sentences)
+        contents = f"I am translating this story sentence-by-sentence:\n\n{german_story_string}"
+        story_context["cache"] = create_cache(story["model"], GRADING_SYSTEM_INSTRUCTION, contents, STORY_CACHE_TTL_SECONDS)
+        if not story_context["cache"]:
+            story_context["mode"] = "window"
+    return story_context
+
+
+def get_sentence_context(story_context, index):
+    sentences = [sentence.german for sentence in story_context["sentences"]]
+    match story_context["mode"]:
+        case "cache":
+            text = None
+        case "window":
+            window = story_context["window"]
+            text = " ".join(sentences[max(0, index - window):index + window + 1])
+        case _:
+            text = " ".join(sentences)
+    return dict(mode=story_context["mode"], cache=story_context["cache"], text=text, session_mode=story_context.get("session_mode"))
+
+
+def get_batch_context(story_context, indexes):
+    sentences = [sentence.german for sentence in story_context["sentences"]]
+    match story_context["mode"]:
+        case "cache":
+            text = None
+        case "window":
+            window = story_context["window"]
+            text = " ".join(sentences[max(0, min(indexes) - window):max(indexes) + window + 1])
+        case _:
+            text = " ".join(sentences)
+    return dict(mode=story_context["mode"], cache=story_context["cache"], text=text, session_mode=story_context.get("session_mode"))
+
+
+def get_grading_config(context, response_schema, system_instruction=GRADING_SYSTEM_INSTRUCTION):
+    from google.genai import types
+    if context["cache"]:
+        return types.GenerateContentConfig(
+            cached_content=context["cache"],
+            response_mime_type="application/json",
+            response_schema=response_schema,
+        )
+    return types.GenerateContentConfig(
+        system_instruction=system_instruction,
+        response_mime_type="application/json",
+        response_schema=response_schema,
+    )
+
+
+def get_story_preamble(context):
+    if context["cache"]:
+        return ""
+    if context["mode"] == "window":
+        return f"Here is the part of the story I am translating sentence-by-sentence:\n\n{context['text']}\n\n"
+    return f"I am translating this story sentence-by-sentence:\n\n{context['text']}\n\n"
+
+
+def get_grading_request(sentence, answer, context, response_schema=None):
+    from schemas import Feedback, ConfidentFeedback
+    if response_schema is None:
+        response_schema = Feedback
+    system_instruction = GRADING_SYSTEM_INSTRUCTION
+    if response_schema is ConfidentFeedback:
+        system_instruction += CASCADE_SYSTEM_INSTRUCTION
+    config = get_grading_config(context, response_schema, system_instruction)
+    story = get_story_preamble(context)
+    contents = f"{story}Here is the sentence I am attempting to translate: {sentence.german}.\nHere is my translation: {answer}\nPlease check my translation and give me your feedback."
+    return config, contents
+
+
+def get_batch_grading_request(pairs, context):
+    from schemas import BatchFeedback
+    config = get_grading_config(context, BatchFeedback)
+    story = get_story_preamble(context)
+    translations = ""
+    for index, (sentence, answer) in enumerate(pairs):
+        translations += f"\n{index}. Sentence: {sentence.german}\n   My translation: {answer}\n"
+    contents = f"{story}Here are my translations of several sentences:\n{translations}\nPlease check each translation separately and give me your feedback for each one with its number as the index."
+    return config, contents
+
+
+def get_feedback(sentence, answer, context, model, write=print, response_schema=None):
+    config, contents = get_grading_request(sentence, answer, context, response_schema)
+    validated = False
+    retry_count = 0
+    delay = INITIAL_DELAY_SECONDS
+    while not validated and retry_count < MAX_RETRIES:
+        feedback = get_parsed_response(
+            model, config, contents, refresh=retry_count > 0, purpose="grade", sentences=1, session_mode=context.get("session_mode"), write=write
+        )
+        if isinstance(feedback, config.response_schema):
+            validated = True
+        else:
+            retry_count += 1
+            if retry_count < MAX_RETRIES:
+                write(f"The Gemini response is invalid. Retrying in {delay} seconds... (Attempt {retry_count}/{MAX_RETRIES})\n")
+                time.sleep(delay)
+                delay *= 2
+            else:
+                write(f"The Gemini response is invalid. Maximum retries reached.")
+
+    if not validated:
+        write("Gemini response was invalid after multiple attempts. Exiting.")
+        sys.exit(1)
+
+    return feedback
+
+
+def save_feedback(sentence, answer, feedback):
+    if feedback.correct:
+        save_answer(sentence.id, answer)
+    else:
+        save_incorrect_answer(sentence.id, answer, feedback.feedback)
+
+
+def get_cascade_threshold():
+    # Returns None unless the cascade is switched on
+    if not os.environ.get("KUMPEL_GRADING_CASCADE"):
+        return None
+    return float(os.environ.get("KUMPEL_CASCADE_THRESHOLD", DEFAULT_CASCADE_THRESHOLD))
+
+
+def request_cascade_feedback(sentence, answer, context, model, threshold, write=print):
+    # Grades with Flash-Lite and escalates to the story's model when unsure
+    from schemas import Feedback, ConfidentFeedback
+    start = time.perf_counter()
+    feedback = get_feedback(sentence, answer, context, CASCADE_MODEL, write, ConfidentFeedback)
+    add_stat(cascade_stats, "graded")
+    add_stat(cascade_stats, "cascade_seconds", time.perf_counter() - start)
+    if feedback.confidence < threshold:
+        start = time.perf_counter()
+        feedback = get_feedback(sentence, answer, context, model, write)
+        add_stat(cascade_stats, "escalations")
+        add_stat(cascade_stats, "escalation_seconds", time.perf_counter() - start)
+    feedback = Feedback(correct=feedback.correct, feedback=feedback.feedback)
+    save_feedback(sentence, answer, feedback)
+    return feedback
+
+
+def summarize_cascade():
+    # Estimates the time saved by comparing every cascade check with the
+    # average escalated check. None until an answer has been escalated.
+    graded = cascade_stats["graded"]
+    escalations = cascade_stats["escalations"]
+    saved_seconds = None
+    if escalations:
+        model_seconds = cascade_stats["escalation_seconds"] / escalations
+        saved_seconds = graded * model_seconds - cascade_stats["cascade_seconds"] - cascade_stats["escalation_seconds"]
+    return dict(
+        graded=graded,
+        escalations=escalations,
+        escalation_share=escalations / graded if graded else 0.0,
+        saved_seconds=saved_seconds,
+    )
+
+
+def request_feedback(sentence, answer, context, model, write=print):
+    # The cascade needs the story in the prompt, a context cache belongs to
+    # the story's model.
+    threshold = get_cascade_threshold()
+    if threshold is not None and model != CASCADE_MODEL and not context["cache"]:
+        return request_cascade_feedback(sentence, answer, context, model, threshold, write)
+    feedback = get_feedback(sentence, answer, context, model, write)
+    save_feedback(sentence, answer, feedback)
+    return feedback
+
+
+def request_feedback_once(sentence, answer, context, model, write=print):
+    # Identical checks that arrive while one is in progress wait for its
+    # Feedback instead of sending their own request. The answer is only
+    # cached once the first check has been saved.
+    key = (sentence.id, normalize_answer(answer))
+    with in_flight_lock:
+        future = in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = in_flight[key] = Future()
+        else:
+            add_stat(cache_stats, "coalesced")
+    if not leader:
+        return future.result()
+    try:
+        feedback = request_feedback(sentence, answer, context, model, write)
+        future.set_result(feedback)
+        return feedback
+    except BaseException as e:
+        # Waiting checks fail the same way, e.g. when Gemini keeps failing
+        future.set_exception(e)
+        raise
+    finally:
+        with in_flight_lock:
+            del in_flight[key]
+
+
+def grade_answer(sentence, answer, context, model, write=print):
+    feedback = lookup_answer(sentence, answer)
+    if not feedback:
+        feedback = request_feedback_once(sentence, answer, context, model, write)
+    return feedback
+
+
+def request_batch_feedback(pairs, context, model, write=print):
+    from schemas import Feedback
+    config, contents = get_batch_grading_request(pairs, context)
+    validated = False
+    retry_count = 0
+    delay = INITIAL_DELAY_SECONDS
+    while not validated and retry_count < MAX_RETRIES:
+        batch_feedback = get_parsed_response(
+            model, config, contents, refresh=retry_count > 0, purpose="grade", sentences=len(pairs), session_mode=context.get("session_mode"), write=write
+        )
+        results = {}
+        if isinstance(batch_feedback, config.response_schema):
+            results = {result.index: result for result in batch_feedback.results}
+        if set(results) == set(range(len(pairs))):
+            validated = True
+        else:
+            retry_count += 1
+            if retry_count < MAX_RETRIES:
+                write(f"The Gemini response is invalid. Retrying in {delay} seconds... (Attempt {retry_count}/{MAX_RETRIES})\n")
+                time.sleep(delay)
+                delay *= 2
+            else:
+                write(f"The Gemini response is invalid. Maximum retries reached.")
+
+    if not validated:
+        write("Gemini response was invalid after multiple attempts. Exiting.")
+        sys.exit(1)
+
+    feedbacks = []
+    for index, (sentence, answer) in enumerate(pairs):
+        feedback = Feedback(correct=results[index].correct, feedback=results[index].feedback)
+        save_feedback(sentence, answer, feedback)
+        feedbacks.append(feedback)
+    return feedbacks
+
+
+@span("grade_batch")
+def grade_batch(pairs, context, model, write=print):
+    # Grades a list of (StorySentence, answer) pairs with at most one request
+    feedbacks = [lookup_answer(sentence, answer) for sentence, answer in pairs]
+    unresolved = [index for index, feedback in enumerate(feedbacks) if not feedback]
+    if len(unresolved) == 1:
+        sentence, answer = pairs[unresolved[0]]
+        feedbacks[unresolved[0]] = request_feedback(sentence, answer, context, model, write)
+    elif unresolved:
+        batch_feedbacks = request_batch_feedback([pairs[index] for index in unresolved], context, model, write)
+        for index, feedback in zip(unresolved, batch_feedbacks):
+            feedbacks[index] = feedback
+    return feedbacks
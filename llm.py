@@ -0,0 +1,337 @@
+import os
+import re
+import sys
+import time
+import random
+import sqlite3
+import threading
+from collections import deque
+from ratelimit import acquire, settle, penalize, estimate_tokens
+from db import save_llm_call
+
+
+# Gemini API retry config
+MAX_RETRIES = 5
+INITIAL_DELAY_SECONDS = 15
+
+
+# HTTP connection pool config
+# httpx drops idle connections after 5 seconds by default, which is shorter
+# than the time a learner spends typing an answer.
+POOL_MAX_CONNECTIONS = 10
+POOL_MAX_KEEPALIVE_CONNECTIONS = 10
+POOL_KEEPALIVE_EXPIRY_SECONDS = 120
+
+
+# Gemini API key and shared client
+api_key = None
+client = None
+client_lock = threading.Lock()
+
+
+# LLM backend: "gemini" or "fake" for the offline stand-in in fakebackend.py.
+# KUMPEL_CASSETTE records the backend's responses to a file or replays them.
+DEFAULT_BACKEND = "gemini"
+backend = None
+
+
+# Paid tier prices per million tokens: (input, output). Cached input tokens
+# cost a quarter of the input price and thinking tokens count as output.
+PRICES = {
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+}
+CACHED_INPUT_DISCOUNT = 0.25
+
+
+# Per-call timing records of the latest calls. The server runs for days,
+# so older records are dropped.
+CALL_LOG_SIZE = 1000
+call_log = deque(maxlen=CALL_LOG_SIZE)
+
+
+def set_api_key(key):
+    global api_key
+    api_key = key
+
+
+def get_client():
+    global client
+    if client is None:
+        with client_lock:
+            if client is None:
+                # The Gemini SDK is slow to import, so it is only loaded once
+                # the first request is made.
+                import httpx
+                from google import genai
+                from google.genai import types
+                limits = httpx.Limits(
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY_SECONDS,
+                )
+                http_options = types.HttpOptions(client_args={"limits": limits})
+                client = genai.Client(api_key=api_key, http_options=http_options)
+    return client
+
+
+def close_client():
+    global client
+    with client_lock:
+        if client is not None:
+            client.close()
+            client = None
+
+
+class GeminiBackend:
+    # Sends requests to the Gemini API through the shared client
+
+    def generate_content(self, model, config, contents):
+        return get_client().models.generate_content(model=model, config=config, contents=contents)
+
+    def generate_content_stream(self, model, config, contents):
+        return get_client().models.generate_content_stream(model=model, config=config, contents=contents)
+
+    def create_cache(self, model, config):
+        return get_client().caches.create(model=model, config=config).name
+
+    def delete_cache(self, name):
+        get_client().caches.delete(name=name)
+
+
+def get_backend():
+    global backend
+    if backend is None:
+        with client_lock:
+            if backend is None:
+                name = os.environ.get("KUMPEL_BACKEND", DEFAULT_BACKEND)
+                cassette = os.environ.get("KUMPEL_CASSETTE")
+                cassette_mode = os.environ.get("KUMPEL_CASSETTE_MODE", "replay")
+                if cassette and cassette_mode == "replay":
+                    from cassette import ReplayBackend
+                    recorded_latency = os.environ.get("KUMPEL_CASSETTE_LATENCY") == "recorded"
+                    backend = ReplayBackend(cassette, recorded_latency)
+                elif name == "fake":
+                    from fakebackend import FakeBackend
+                    backend = FakeBackend.from_env()
+                else:
+                    backend = GeminiBackend()
+                if cassette and cassette_mode == "record":
+                    from cassette import RecordingBackend
+                    backend = RecordingBackend(backend, cassette)
+    return backend
+
+
+def needs_api_key():
+    # The fake backend and cassette replays never reach Gemini
+    if os.environ.get("KUMPEL_BACKEND") == "fake":
+        return False
+    return not (using_cassette() and os.environ.get("KUMPEL_CASSETTE_MODE", "replay") == "replay")
+
+
+def using_cassette():
+    # Recorded runs are replayed request for request, so the response and
+    # answer caches are bypassed while recording and replaying
+    return bool(os.environ.get("KUMPEL_CASSETTE"))
+
+
+def set_backend(new_backend):
+    # Replaces the backend, e.g. with a FakeBackend in tests and benchmarks
+    global backend
+    backend = new_backend
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, output_tokens):
+    input_price, output_price = PRICES.get(model, (0.0, 0.0))
+    input_cost = (prompt_tokens - cached_tokens + cached_tokens * CACHED_INPUT_DISCOUNT) * input_price
+    return (input_cost + output_tokens * output_price) / 1_000_000
+
+
+def save_call(model, purpose, sentences, seconds, retries=0, wait_seconds=0.0, usage=None, cache_hit=False, session_mode=None):
+    # Stores the call in the llm_call table for main.py --stats. session_mode
+    # is the learn, practice or test mode of the session the call belongs to.
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+    response_tokens = getattr(usage, "candidates_token_count", None) or 0
+    thoughts_tokens = getattr(usage, "thoughts_token_count", None) or 0
+    try:
+        save_llm_call(dict(
+            model=model,
+            purpose=purpose,
+            mode=session_mode,
+            sentences=sentences,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            response_tokens=response_tokens,
+            seconds=seconds,
+            retries=retries,
+            wait_seconds=wait_seconds,
+            cache_hit=int(cache_hit),
+            cost=estimate_cost(model, prompt_tokens, cached_tokens, response_tokens + thoughts_tokens),
+        ))
+    except sqlite3.Error as e:
+        # Telemetry never ends a session, e.g. when the database is locked
+        if os.environ.get("KUMPEL_TIMINGS"):
+            print(f" LLM call not recorded: {str(e)}")
+
+
+def count_sentences(parsed):
+    # Stories count their sentences, anything else counts as none
+    return len(getattr(parsed, "sentences", None) or [])
+
+
+def record_call(model, seconds, attempts, usage=None, wait_seconds=0.0, purpose=None, sentences=0, session_mode=None, write=print):
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+    response_tokens = getattr(usage, "candidates_token_count", None) or 0
+    save_call(model, purpose, sentences, seconds, attempts - 1, wait_seconds, usage, session_mode=session_mode)
+    record = dict(
+        model=model,
+        seconds=seconds,
+        attempts=attempts,
+        prompt_tokens=prompt_tokens,
+        cached_tokens=cached_tokens,
+        response_tokens=response_tokens,
+        wait_seconds=wait_seconds,
+    )
+    call_log.append(record)
+    if os.environ.get("KUMPEL_TIMINGS"):
+        write(f" Gemini call ({model}): {seconds:.2f}s, {attempts} attempt(s), {wait_seconds:.2f}s waiting, {prompt_tokens} prompt tokens ({cached_tokens} cached)")
+    return record
+
+
+def summarize_calls(records=None):
+    if records is None:
+        records = call_log
+    summary = dict(calls=len(records), seconds=0.0, wait_seconds=0.0, prompt_tokens=0, cached_tokens=0, response_tokens=0)
+    for record in records:
+        for key in ["seconds", "wait_seconds", "prompt_tokens", "cached_tokens", "response_tokens"]:
+            summary[key] += record[key]
+    return summary
+
+
+def create_cache(model, system_instruction, contents, ttl_seconds):
+    from google.genai import types
+    config = types.CreateCachedContentConfig(
+        display_name="kumpel-story",
+        system_instruction=system_instruction,
+        contents=[contents],
+        ttl=f"{ttl_seconds}s",
+    )
+    try:
+        name = get_backend().create_cache(model, config)
+    except Exception as e:
+        # Stories shorter than the model's minimum cacheable size are rejected.
+        if os.environ.get("KUMPEL_TIMINGS"):
+            print(f" Gemini context cache unavailable: {str(e)}")
+        return None
+    return name
+
+
+def delete_cache(name):
+    try:
+        get_backend().delete_cache(name)
+    except Exception:
+        # The cache expires on its own after its TTL.
+        pass
+
+
+def get_retry_after(error):
+    # Reads the server's retry hint from a Retry-After header or a RetryInfo
+    # detail such as {"retryDelay": "15s"}.
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details)
+        for detail in details.get("details", []):
+            match = re.fullmatch(r"([\d.]+)s", str(detail.get("retryDelay", "")))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def get_retry_delay(error, delay):
+    # Honours the server's hint if there is one, otherwise backs off with jitter
+    retry_after = get_retry_after(error)
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def get_gemini_response(model, config, contents, purpose=None, sentences=None, session_mode=None, write=print):
+    # sentences is the number of sentences graded, or None to count the
+    # sentences of a generated story. Messages go through write, so requests
+    # running in the background don't print over the session.
+    backend = get_backend()
+    gemini_success = False
+    retry_count = 0
+    delay = INITIAL_DELAY_SECONDS
+    wait_seconds = 0.0
+    estimated_tokens = estimate_tokens(contents)
+
+    while not gemini_success and retry_count < MAX_RETRIES:
+        try:
+            wait_seconds += acquire(model, estimated_tokens)
+            start = time.perf_counter()
+            response = backend.generate_content(model, config, contents)
+            seconds = time.perf_counter() - start
+            gemini_success = True
+
+        except Exception as e:
+            retry_count += 1
+            error_code = getattr(e, 'code', None)
+
+            if error_code in [429, 500, 503, 504]:
+                if error_code == 429:
+                    penalize(model)
+                if retry_count < MAX_RETRIES:
+                    retry_delay = get_retry_delay(e, delay)
+                    write(f" Gemini error (Code: {error_code}). Retrying in {retry_delay:.0f} seconds... (Attempt {retry_count}/{MAX_RETRIES})\n")
+                    time.sleep(retry_delay)
+                    wait_seconds += retry_delay
+                    delay *= 2
+                else:
+                    write(f" Gemini error (Code: {error_code}). Maximum retries reached.")
+            else:
+                write(f" An unrecoverable error occurred: {str(e)}")
+                write("Exiting. Goodbye!")
+                sys.exit(1)
+
+    if not gemini_success:
+        write(" Gemini failed to respond after multiple attempts. Exiting.")
+        sys.exit(1)
+
+    # Recorded outside the retries, so bookkeeping errors are never mistaken
+    # for a failed request
+    usage = response.usage_metadata
+    settle(model, estimated_tokens, getattr(usage, "total_token_count", None))
+    if sentences is None:
+        sentences = count_sentences(response.parsed)
+    record_call(model, seconds, retry_count + 1, usage, wait_seconds, purpose, sentences, session_mode, write)
+    return response
+
+
+def stream_gemini_response(model, config, contents, purpose=None):
+    # Yields the response text as it arrives. Errors are raised to the caller,
+    # which can fall back to get_gemini_response and its retries.
+    backend = get_backend()
+    estimated_tokens = estimate_tokens(contents)
+    wait_seconds = acquire(model, estimated_tokens)
+    start = time.perf_counter()
+    usage = None
+    try:
+        for chunk in backend.generate_content_stream(model, config, contents):
+            if chunk.usage_metadata:
+                usage = chunk.usage_metadata
+            yield chunk.text or ""
+    except Exception as e:
+        if getattr(e, 'code', None) == 429:
+            penalize(model)
+        raise
+    settle(model, estimated_tokens, getattr(usage, "total_token_count", None))
+    record_call(model, time.perf_counter() - start, 1, usage, wait_seconds, purpose)
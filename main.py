@@ -1,46 +1,40 @@
 import os
 import sys
-import time
 import re
 import copy
 import json
-import random
-from db import DB, init_db, load_stories, load_story, save_story, save_answer, check_cache
+import argparse
+import threading
+from concurrent.futures import Future
+from db import DB, init_db, upgrade_db, has_stories, find_story, load_story_page, load_story, load_references, save_story, save_sentence
 from ansitext import Style, Color, stylize
-from texttable import Texttable
+from screen import Screen, HeldMessages
+from profiling import span, profiling_requested, run_profiled
 from dotenv import load_dotenv
-from google import genai
-from pydantic import BaseModel
-from google.genai import types
-from yaspin import yaspin
+from grading import cache_stats, summarize_cascade, grade_answer, grade_batch, get_story_context, get_sentence_context, get_batch_context
+from streaming import StoryStream
+from generation import get_story_request, request_story
+from llm import set_api_key, needs_api_key, delete_cache, call_log, summarize_calls
+from stats import STATS_HEADERS, get_call_stats, format_call_stats
+from responsecache import response_cache_stats
+from pool import take_story, store_story, refill_pool, get_pool_report
+from checkpoint import start_checkpoint, checkpoint_content, checkpoint_mode, checkpoint_progress, finish_checkpoint, load_checkpoint
 
 
-# Gemini API key global
-api_key = None
+# Background answer checking in Test mode
+GRADING_WORKERS = 4
+GRADING_BATCH_SIZE = 5
 
 
-# Gemini API retry config
-MAX_RETRIES = 5
-INITIAL_DELAY_SECONDS = 15
+# Saved story browser
+STORY_PAGE_SIZE = 10
+STORY_LEVELS = ["complete beginner", "A1", "A2", "B1", "B2", "C1", "C2"]
+STORY_MODELS = ["gemini-2.5-flash", "gemini-2.5-flash-lite", "gemini-2.5-pro"]
 
 
-# Gemini response schema
-class StorySentence(BaseModel):
-    id: int
-    german: str
-    english: str
-
-
-# Gemini response schema
-class Story(BaseModel):
-    story_name: str
-    sentences: list[StorySentence]
-
-
-# Gemini response schema
-class Feedback(BaseModel):
-    correct: bool
-    feedback: str
+# Speculative story generation assumes the default answers: no topic, no
+# style and the recommended model.
+SPECULATIVE_MODEL = "gemini-2.5-flash"
 
 
 # Logo
@@ -59,45 +53,156 @@ arrow = stylize(Color.YELLOW, "  ", Style.BOLD)
 header = stylize(Color.YELLOW, " ", Style.BOLD)
 story_length = 0
 story_progress = []
+screen = Screen()
 
 
 def main():
-    global api_key
     global story_length
+    parser = argparse.ArgumentParser(description="Learn German with stories generated by Gemini.")
+    parser.add_argument("--refill-pool", action="store_true", help="generate stories for the story pool and exit")
+    parser.add_argument("--stats", action="store_true", help="print latency, token and cost stats of past LLM calls and exit")
+    args = parser.parse_args()
+    if args.stats:
+        print_stats()
+        return
     load_dotenv()
     api_key = os.environ.get("KUMPEL_GEMINI_API_KEY")
-    if not api_key:
+    if not api_key and needs_api_key():
         raise ValueError("Missing API key. Add KUMPEL_GEMINI_API_KEY to kumpel/.env e.g. KUMPEL_GEMINI_API_KEY=your_api_key")
+    set_api_key(api_key)
+    if args.refill_pool:
+        run_pool_refill()
+        return
     try:
         update_header(stylize(Color.CYAN, "Start"))
         new_screen()
         print(stylize(Color.BLUE, logo, Style.BOLD))
         story = get_story()
-        story_length = len(story["content"].sentences)
+        if not story.get("session"):
+            start_checkpoint(story)
+        story_length = get_story_length(story)
         update_header(arrow + stylize(Color.CYAN, "Story: ") + story['content'].story_name)
-        mode = get_mode()
+        if story.get("mode"):
+            mode = story["mode"]
+            update_header(arrow + stylize(Color.CYAN, "Mode: ") + mode.capitalize())
+        else:
+            mode = get_mode()
+            checkpoint_mode(story, mode)
         new_screen()
+        call_log.clear()
         conduct_session(story, mode)
         new_screen()
+        print_call_summary(call_log)
         save(story)
+        finish_checkpoint(story)
         print(stylize(Color.MAGENTA, "I hope you enjoyed the story! Goodbye!\n"))
     except KeyboardInterrupt:
-        os.system("clear")
+        screen.clear()
         print("Goodbye!")
         sys.exit(0)
+    finally:
+        screen.close()
 
 
+@span("new_screen")
 def new_screen():
     global header
     global story_length
     global story_progress
-    os.system("clear")
-    print(header, "\n")
+    screen.render(get_screen_lines(header, story_progress, story_length, screen.get_max_lines()))
+
+
+def get_screen_lines(header, story_progress, story_length, max_lines):
+    # Only the latest sentences are shown once the progress outgrows the
+    # terminal
+    lines = [header, ""]
     if len(story_progress) > 0:
-        print(stylize(Color.YELLOW, "Progress", Style.UNDERLINE) + stylize(Color.YELLOW, f" ({len(story_progress)}/{story_length})"))
-        for sentence in story_progress:
-            print(sentence)
-        print()
+        lines.append(stylize(Color.YELLOW, "Progress", Style.UNDERLINE) + stylize(Color.YELLOW, f" ({len(story_progress)}/{story_length or '?'})"))
+        shown = max(2, max_lines - len(lines) - 1)
+        if len(story_progress) > shown:
+            shown -= 1
+            lines.append(stylize(Color.YELLOW, f"... {len(story_progress) - shown} earlier sentences"))
+            lines += story_progress[-shown:]
+        else:
+            lines += story_progress
+        lines.append("")
+    return lines
+
+
+def get_story_length(story):
+    # Unknown while a streamed story is still being generated
+    stream = story.get("stream")
+    if stream and not stream.done:
+        return None
+    return len(story["content"].sentences)
+
+
+def iter_sentences(story):
+    global story_length
+    stream = story.get("stream")
+    if not stream:
+        for sentence in story["content"].sentences:
+            yield share_sentence(story, sentence)
+        return
+    for sentence in stream:
+        yield share_sentence(story, sentence)
+    if stream.error:
+        print(stylize(Color.RED, f"Story generation stopped early: {str(stream.error)}\n"))
+    story["content"] = stream.result()
+    story_length = len(story["content"].sentences)
+    checkpoint_content(story)
+
+
+def share_sentence(story, sentence):
+    # Sentences of unsaved stories get their shared ids too, so their answers
+    # are cached for every story containing the same sentence
+    if story["id"] is None:
+        sentence.id = save_sentence(sentence.german, sentence.english)
+    return sentence
+
+
+def print_call_summary(records):
+    if not os.environ.get("KUMPEL_TIMINGS"):
+        return
+    summary = summarize_calls(records)
+    print(f"Gemini calls: {summary['calls']}, {summary['seconds']:.2f}s, {summary['wait_seconds']:.2f}s waiting, {summary['prompt_tokens']} prompt tokens ({summary['cached_tokens']} cached)")
+    print(f"Answer cache: {cache_stats['local_hits']} local hits, {cache_stats['hits']} hits, {cache_stats['fuzzy_hits']} fuzzy hits, {cache_stats['incorrect_hits']} incorrect hits, {cache_stats['misses']} misses, {cache_stats['coalesced']} coalesced")
+    print(f"Response cache: {response_cache_stats['hits']} hits, {response_cache_stats['misses']} misses")
+    cascade = summarize_cascade()
+    if cascade["graded"]:
+        saved = "unknown" if cascade["saved_seconds"] is None else f"{cascade['saved_seconds']:.2f}s"
+        print(f"Grading cascade: {cascade['escalations']}/{cascade['graded']} escalated ({cascade['escalation_share']:.0%}), {saved} saved")
+    print()
+
+
+def run_pool_refill():
+    if not os.path.exists(DB):
+        init_db()
+    upgrade_db()
+    with spinner("Refilling story pool") as sp:
+        result = refill_pool()
+        sp.text = f"Generated {result['generated']} of {result['requested']} stories"
+        sp.green.ok("✔")
+    print(get_pool_report())
+
+
+def print_stats():
+    from texttable import Texttable
+    if not os.path.exists(DB):
+        print("No LLM calls recorded yet.")
+        return
+    upgrade_db()
+    call_stats = get_call_stats()
+    if not call_stats:
+        print("No LLM calls recorded yet.")
+        return
+    table = Texttable(max_width=0)
+    table.set_cols_align(["l", "l", "l", "r", "r", "r", "r", "r", "r", "r"])
+    table.set_deco(Texttable.BORDER | Texttable.HEADER)
+    table.set_cols_dtype(["t"] * len(STATS_HEADERS))
+    table.add_rows([STATS_HEADERS] + format_call_stats(call_stats))
+    print(stylize(Color.BLUE, "LLM calls", Style.BOLD))
+    print(table.draw())
 
 
 def update_header(update):
@@ -105,43 +210,77 @@ def update_header(update):
     header += update
 
 
+@span("get_story")
 def get_story():
     if not os.path.exists(DB):
         init_db()
+    upgrade_db()
 
-    stories = load_stories()
-    if not stories:
+    saved = has_stories()
+    checkpoint = load_checkpoint()
+    if not saved and not checkpoint:
         print(stylize(Color.MAGENTA, "You have no saved stories. Let's generate a story.\n"))
-        input("Hit Enter to proceed.")
+        read_input("Hit Enter to proceed.")
     else:
+        choices = ["saved"] if saved else []
+        choices.append("generate")
+        if checkpoint:
+            choices.append("resume")
+        descriptions = dict(saved="Use a saved story.", generate="Generate a new story.")
+        if checkpoint:
+            passed = len(checkpoint["passed"])
+            length = len(checkpoint["content"].sentences)
+            descriptions["resume"] = f"Resume your last session: {checkpoint['content'].story_name} ({passed}/{length} sentences)."
+        options = "\n".join(f"{number}. {descriptions[choice]}" for number, choice in enumerate(choices, start=1))
         message = f"""{stylize(Color.MAGENTA, "What do you want to do?")}
 
-1. Use a saved story.
-2. Generate a new story.
+{options}
 
 Respond with the number for your selection."""
-        pattern = r"^[1,2]$"
-        invalid_message = "Answer must be a number: 1 or 2"
-        source = get_user_input(message, pattern, invalid_message)
-        if source == "1":
-            return get_saved_story(stories)
+        pattern = rf"^[1-{len(choices)}]$"
+        invalid_message = f"Answer must be a number from 1 to {len(choices)}."
+        source = choices[int(get_user_input(message, pattern, invalid_message)) - 1]
+        if source == "saved":
+            return get_saved_story()
+        if source == "resume":
+            return resume_session(checkpoint)
 
     update_header(arrow + stylize(Color.CYAN, "Generate story"))
     new_screen()
     level = get_german_level()
+    speculation = None
+    if os.environ.get("KUMPEL_SPECULATIVE_STORY"):
+        speculation = start_speculation(level, None, None, SPECULATIVE_MODEL)
+    try:
+        new_screen()
+        topic = get_user_topic()
+        new_screen()
+        style = get_particular_style()
+        new_screen()
+        model = get_model_choice()
+    except KeyboardInterrupt:
+        if speculation:
+            release_speculation(speculation)
+        raise
     new_screen()
-    topic = get_user_topic()
-    new_screen()
-    style = get_particular_style()
-    new_screen()
-    model = get_model_choice()
-    new_screen()
-    content = generate_story(level, topic, style, model)
-    story = dict(id=None, level=level, topic=topic, style=style, model=model, content=content)
+    stream = None
+    content = take_story((level, topic, style, model))
+    if content:
+        print(f"{stylize(Color.GREEN, '✔ Story from the pool:')} {content.story_name}\n")
+    if content and speculation:
+        release_speculation(speculation)
+    elif speculation:
+        content = finish_speculation(speculation, (level, topic, style, model))
+    if not content and os.environ.get("KUMPEL_STREAM_STORY"):
+        content, stream = stream_story(level, topic, style, model)
+    elif not content:
+        content = generate_story(level, topic, style, model)
+    story = dict(id=None, level=level, topic=topic, style=style, model=model, content=content, stream=stream)
     return story
 
 
 def print_saved_stories(stories):
+    from texttable import Texttable
     saved_stories = copy.deepcopy(stories)
     # id, name, level, topic, style, model
     table = Texttable()
@@ -163,52 +302,129 @@ def print_saved_stories(stories):
     print("\033[0m", end="")
 
 
-def get_saved_story(stories):
+def get_saved_story():
+    # Shows one page of stories at a time. Any story can be picked by its ID,
+    # whichever page is shown.
     update_header(arrow + stylize(Color.CYAN, "Load story"))
-    new_screen()
-    print_saved_stories(stories)
-    story_ids = [str(story["id"]) for story in stories]
-    message = f"""{stylize(Color.MAGENTA, "Which story would you like to use?")}
-
-Respond with the story ID."""
-    id_string = "|".join(story_ids)
-    pattern = rf"^({id_string})$"
-    invalid_message = "Answer must be one of the story IDs."
-    story_id = get_user_input(message, pattern, invalid_message)
-    story = next((story for story in stories if str(story["id"]) == story_id), None)
+    filters = dict(level=None, model=None, search=None)
+    pages = [0]
+    notice = None
+    while True:
+        new_screen()
+        stories = load_story_page(pages[-1], STORY_PAGE_SIZE + 1, **filters)
+        has_next = len(stories) > STORY_PAGE_SIZE
+        stories = stories[:STORY_PAGE_SIZE]
+        if stories:
+            print_saved_stories(stories)
+        else:
+            print(stylize(Color.BLUE, "No saved stories match.\n", Style.BOLD))
+        print(get_browser_status(len(pages), filters))
+        if notice:
+            print(stylize(Color.RED, notice))
+        notice = None
+        commands = []
+        if has_next:
+            commands.append("n for the next page")
+        if len(pages) > 1:
+            commands.append("p for the previous page")
+        commands += ["s to search", "f to filter by level and model"]
+        message = f"""{stylize(Color.MAGENTA, "Which story would you like to use?")}
+
+Respond with the story ID, or {", ".join(commands)}."""
+        # Story IDs are capped at 18 digits to fit an SQLite integer
+        pattern = r"^(\d{1,18}|n|p|s|f)$"
+        invalid_message = "Answer must be a story ID or one of the letters above."
+        choice = get_user_input(message, pattern, invalid_message)
+        match choice:
+            case "n":
+                if has_next:
+                    pages.append(stories[-1]["id"])
+            case "p":
+                if len(pages) > 1:
+                    pages.pop()
+            case "s":
+                print()
+                filters["search"] = read_input("Search story names and sentences (Enter to clear): ").strip() or None
+                pages = [0]
+            case "f":
+                filters.update(get_story_filters())
+                pages = [0]
+            case _:
+                story = find_story(int(choice))
+                if story:
+                    break
+                notice = f"There is no story with the ID {choice}."
     if story:
         new_screen()
         print(f"{stylize(Color.GREEN, '✔ Loaded story:')} {story['name']}\n")
-        level = story["level"]
-        topic = "Custom" if story["topic"] else "None"
-        style = "Custom" if story["style"] else "None"
-        model = model_code_to_text(story["model"])
+        from schemas import parse_story_sentences
         story_sentences = load_story(story["id"])
-        story["content"] = parse_story_sentences(story["name"], story_sentences)
-        update_header(
-            arrow +
-            stylize(Color.CYAN, "Level: ") + level +
-            arrow +
-            stylize(Color.CYAN, "Topic: ") + topic +
-            arrow +
-            stylize(Color.CYAN, "Style: ") + style +
-            arrow +
-            stylize(Color.CYAN, "Model: ") + model
-        )
+        references = load_references(story["id"])
+        story["content"] = parse_story_sentences(story["name"], story_sentences, references)
+        update_story_header(story)
         return story
     raise Exception("An error occurred getting saved story.")
 
 
-def parse_story_sentences(name, sentences):
-    content = Story(story_name=name, sentences=[])
-    for sen in sentences:
-        story_sentence = StorySentence(
-            id=sen["id"],
-            german=sen["de"],
-            english=sen["en"]
-        )
-        content.sentences.append(story_sentence)
-    return content
+def resume_session(story):
+    # Everything needed comes from the checkpoint, so no API calls are made
+    global story_progress
+    update_header(arrow + stylize(Color.CYAN, "Resume session"))
+    new_screen()
+    print(f"{stylize(Color.GREEN, '✔ Resumed story:')} {story['content'].story_name}\n")
+    sentences = story["content"].sentences
+    story_progress = [sentences[index].german for index in story["passed"]]
+    update_story_header(story)
+    return story
+
+
+def update_story_header(story):
+    level = story["level"]
+    topic = "Custom" if story["topic"] else "None"
+    style = "Custom" if story["style"] else "None"
+    model = model_code_to_text(story["model"])
+    update_header(
+        arrow +
+        stylize(Color.CYAN, "Level: ") + level +
+        arrow +
+        stylize(Color.CYAN, "Topic: ") + topic +
+        arrow +
+        stylize(Color.CYAN, "Style: ") + style +
+        arrow +
+        stylize(Color.CYAN, "Model: ") + model
+    )
+
+
+def get_browser_status(page, filters):
+    status = f"Page {page}"
+    if filters["level"]:
+        status += f", level {filters['level']}"
+    if filters["model"]:
+        status += f", model {model_code_to_text(filters['model'])}"
+    if filters["search"]:
+        status += f", matching \"{filters['search']}\""
+    return stylize(Color.BLUE, status) + "\n"
+
+
+def get_story_filters():
+    print()
+    message = f"""{stylize(Color.MAGENTA, "Which level?")}
+
+1. Beginner  2. A1  3. A2  4. B1  5. B2  6. C1  7. C2
+
+Respond with the number, or hit Enter for any level."""
+    level = get_user_input(message, r"^[1-7]?$", "Answer must be a number from 1 to 7, or empty.")
+    print()
+    message = f"""{stylize(Color.MAGENTA, "Which model?")}
+
+1. Flash  2. Flash-Lite  3. Pro
+
+Respond with the number, or hit Enter for any model."""
+    model = get_user_input(message, r"^[1-3]?$", "Answer must be a number from 1 to 3, or empty.")
+    return dict(
+        level=STORY_LEVELS[int(level) - 1] if level else None,
+        model=STORY_MODELS[int(model) - 1] if model else None,
+    )
 
 
 def model_code_to_text(model_code):
@@ -374,8 +590,8 @@ def save(story):
         save = get_user_input(message, pattern, invalid_message)
         print()
         if save == "1":
-            with yaspin(text="Saving story") as sp:
-                save_story(story)
+            with spinner("Saving story") as sp:
+                story["id"] = save_story(story)
                 sp.text = "Story saved"
                 sp.green.ok("✔")
                 print()
@@ -386,11 +602,17 @@ def get_user_input(message, pattern, invalid_message):
     valid_input = False
     print(message + "\n")
     while valid_input == False:
-        user_input = input("Your answer: ")
+        user_input = read_input("Your answer: ")
         valid_input = validate_input(user_input, pattern, invalid_message)
     return user_input
 
 
+@span("user_input")
+def read_input(prompt):
+    # Time spent here is the learner's, not ours
+    return input(prompt)
+
+
 def validate_input(user_input, pattern, invalid_message):
     match = re.fullmatch(pattern, user_input)
     if match:
@@ -400,15 +622,29 @@ def validate_input(user_input, pattern, invalid_message):
 
 
 def conduct_session(story, mode):
-    global story_progress
-    german_sentences = [sentence.german for sentence in story["content"].sentences]
-    german_story_string = " ".join(german_sentences)
-    for sentence in story["content"].sentences:
+    story_context = get_story_context(story, mode)
+    try:
+        run_session(story, mode, story_context)
+    finally:
+        if story_context["cache"]:
+            delete_cache(story_context["cache"])
+
+
+def run_session(story, mode, story_context):
+    # A resumed session skips the sentences passed before
+    if mode == "test":
+        run_test_session(story, story_context)
+        return
+    already_passed = set(story.get("passed", []))
+    for index, sentence in enumerate(iter_sentences(story)):
+        if index in already_passed:
+            continue
+        context = get_sentence_context(story_context, index)
         if mode == "learn":
             passed = False
             print(stylize(Color.BLUE, "German: ", Style.BOLD), sentence.german)
             print()
-            input(stylize(Color.MAGENTA, "Read the sentence.", Style.BOLD) + " Then hit Enter for the translation. ")
+            read_input(stylize(Color.MAGENTA, "Read the sentence.", Style.BOLD) + " Then hit Enter for the translation. ")
             new_screen()
             print(stylize(Color.BLUE, "German: ", Style.BOLD), sentence.german)
             print()
@@ -417,85 +653,236 @@ def conduct_session(story, mode):
                 valid = False
                 while not valid:
                     print()
-                    answer = input(stylize(Color.MAGENTA, "Repeat:  ", Style.BOLD))
+                    answer = read_input(stylize(Color.MAGENTA, "Repeat:  ", Style.BOLD))
                     valid = answer_validation(answer, sentence.english)
-                feedback = check_answer(sentence, answer, german_story_string, story["model"])
+                feedback = check_answer(sentence, answer, context, story["model"])
                 if feedback.correct:
                     passed = True
                 else:
                     print(feedback.feedback)
                 if passed:
-                    input("\nHit Enter to proceed. ")
+                    read_input("\nHit Enter to proceed. ")
                 else:
                     print("\nTry again!")
             new_screen()
-        passed = False
-        print(stylize(Color.BLUE, "German: ", Style.BOLD), sentence.german)
-        while not passed:
-            valid = False
-            while not valid:
-                print()
-                answer = input(stylize(Color.BLUE, 'English: ', Style.BOLD))
-                valid = answer_validation(answer, sentence.english)
-            feedback = check_answer(sentence, answer, german_story_string, story["model"])
+        translate_sentence(story, index, sentence, context, mode)
+
+
+def translate_sentence(story, index, sentence, context, mode):
+    passed = False
+    print(stylize(Color.BLUE, "German: ", Style.BOLD), sentence.german)
+    while not passed:
+        answer = get_translation(sentence)
+        feedback = check_answer(sentence, answer, context, story["model"])
+        if feedback.correct:
+            passed = True
+        else:
+            if mode == "practice" or mode == "learn":
+                print(feedback.feedback)
+        if passed:
+            pass_sentence(story, index, sentence)
+            read_input("\nHit Enter to proceed. ")
+        else:
+            print("\nTry again.")
+    new_screen()
+
+
+def pass_sentence(story, index, sentence):
+    global story_progress
+    story_progress.append(sentence.german)
+    checkpoint_progress(story, index)
+
+
+def get_translation(sentence):
+    valid = False
+    while not valid:
+        print()
+        answer = read_input(stylize(Color.BLUE, 'English: ', Style.BOLD))
+        valid = answer_validation(answer, sentence.english)
+    return answer
+
+
+def run_test_session(story, story_context):
+    # Answers are checked in batches in the background while the learner
+    # moves on to the next sentence. Sentences which failed are asked again
+    # at the end.
+    # Messages from the workers, e.g. retries, are held back while the
+    # learner types and shown under the spinner at the end.
+    sentences = story_context["sentences"]
+    already_passed = set(story.get("passed", []))
+    pending = []
+    failed = []
+    batch = []
+    messages = HeldMessages()
+    workers = threading.BoundedSemaphore(GRADING_WORKERS)
+    try:
+        for index, sentence in enumerate(iter_sentences(story)):
+            if index in already_passed:
+                continue
+            print(stylize(Color.BLUE, "German: ", Style.BOLD), sentence.german)
+            answer = get_translation(sentence)
+            batch.append((index, answer))
+            if len(batch) == GRADING_BATCH_SIZE:
+                pending.append((batch, submit_batch(workers, sentences, batch, story_context, story["model"], messages.write)))
+                batch = []
+            pending = collect_test_results(story, sentences, pending, failed, wait=False)
+            new_screen()
+        if batch:
+            pending.append((batch, submit_batch(workers, sentences, batch, story_context, story["model"], messages.write)))
+        with spinner("Checking answers") as sp:
+            messages.show(sp.write)
+            collect_test_results(story, sentences, pending, failed, wait=True)
+            sp.text = stylize(Color.GREEN, "Answers checked", Style.BOLD)
+            sp.green.ok("✔")
+    except KeyboardInterrupt:
+        # Batches which have not been sent yet are dropped. The ones on
+        # their way run on daemon threads, so quitting doesn't wait for them.
+        for batch, future in pending:
+            future.cancel()
+        raise
+    if failed:
+        new_screen()
+        print(stylize(Color.MAGENTA, f"{len(failed)} of {len(sentences)} sentences need another try.\n"))
+        read_input("Hit Enter to proceed. ")
+        new_screen()
+    for index in sorted(failed):
+        context = get_sentence_context(story_context, index)
+        translate_sentence(story, index, sentences[index], context, "test")
+
+
+def submit_batch(workers, sentences, batch, story_context, model, write):
+    indexes = [index for index, answer in batch]
+    pairs = [(sentences[index], answer) for index, answer in batch]
+    context = get_batch_context(story_context, indexes)
+    return run_in_background(grade_batch, pairs, context, model, write, workers=workers)
+
+
+def run_in_background(function, *args, workers=None):
+    # Runs the function on a daemon thread and returns its Future. workers
+    # is a semaphore which limits how many run at once.
+    future = Future()
+
+    def run():
+        if workers:
+            workers.acquire()
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                # Including the SystemExit of a request which keeps failing
+                future.set_exception(e)
+        finally:
+            if workers:
+                workers.release()
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def collect_test_results(story, sentences, pending, failed, wait):
+    # Returns the batches which are still being checked
+    remaining = []
+    for batch, future in pending:
+        if not wait and not future.done():
+            remaining.append((batch, future))
+            continue
+        for (index, answer), feedback in zip(batch, future.result()):
             if feedback.correct:
-                passed = True
-            else:
-                if mode == "practice" or mode == "learn":
-                    print(feedback.feedback)
-            if passed:
-                story_progress.append(sentence.german)
-                input("\nHit Enter to proceed. ")
+                pass_sentence(story, index, sentences[index])
             else:
-                print("\nTry again.")
-        new_screen()
+                failed.append(index)
+    return remaining
 
 
+@span("generate_story")
 def generate_story(level, topic, style, model):
     new_screen()
-    with yaspin(text="Generating story") as sp:
-        system_instruction = "You are a German storyteller. Your purpose is to provide a story which will help the user learn German."
-        config = types.GenerateContentConfig(
-            system_instruction=system_instruction,
-            response_mime_type="application/json",
-            response_schema=Story,
-        )
-        contents = get_story_prompt_contents(level, topic, style)
-        validated = False
-        retry_count = 0
-        delay = INITIAL_DELAY_SECONDS
-        while not validated and retry_count < MAX_RETRIES:
-            gemini_response = get_gemini_response(model, config, contents)
-            story: Story = gemini_response.parsed
-            if isinstance(story, Story):
-                validated = True
-                sp.text = f"{stylize(Color.GREEN, 'Generated story:')} {story.story_name}"
-                sp.green.ok("✔")
-                print()
-            else:
-                retry_count += 1
-                if retry_count < MAX_RETRIES:
-                    sp.write(f"The Gemini response is invalid. Retrying in {delay} seconds... (Attempt {retry_count}/{MAX_RETRIES})")
-                    time.sleep(delay)
-                    delay *= 2
-                else:
-                    sp.write(f"The Gemini response is invalid. Maximum retries reached.")
-                    sp.red.fail("✘")
+    with spinner("Generating story") as sp:
+        story = request_story(level, topic, style, model, sp.write)
+        if story:
+            sp.text = f"{stylize(Color.GREEN, 'Generated story:')} {story.story_name}"
+            sp.green.ok("✔")
+            print()
+        else:
+            sp.red.fail("✘")
 
-    if not validated:
+    if not story:
         print("Gemini response was invalid after multiple attempts. Exiting.")
         sys.exit(1)
 
     return story
 
 
-def get_story_prompt_contents(level, topic, style):
-    contents = f"My current German level is: {level}. Provide me with a story to help me learn German."
-    if topic:
-        contents += f"\nI want the story to be about this topic/theme: {topic}"
-    if style:
-        contents += f"\nI want the story to be written in this style/genre: {style}"
-    return contents
+def start_speculation(level, topic, style, model):
+    # Starts generating the story the learner will probably ask for while
+    # they answer the remaining config prompts. The request runs on a daemon
+    # thread, so quitting never waits for it, and its messages are held back
+    # until the story is needed.
+    cancelled = threading.Event()
+    messages = HeldMessages()
+    future = run_in_background(request_story, level, topic, style, model, messages.write, cancelled)
+    return dict(key=(level, topic, style, model), future=future, cancelled=cancelled, messages=messages)
+
+
+def finish_speculation(speculation, key):
+    # Returns the speculative story if it matches the final choices
+    if speculation["key"] != key:
+        release_speculation(speculation)
+        return None
+    new_screen()
+    with spinner("Generating story") as sp:
+        speculation["messages"].show(sp.write)
+        story = speculation["future"].result()
+        if story:
+            sp.text = f"{stylize(Color.GREEN, 'Generated story:')} {story.story_name}"
+            sp.green.ok("✔")
+            print()
+        else:
+            sp.red.fail("✘")
+    return story
+
+
+def release_speculation(speculation):
+    # Cancels the speculative request if it has not been sent yet. A story
+    # which is already on its way goes to the story pool instead.
+    speculation["cancelled"].set()
+    if speculation["future"].cancel():
+        return
+
+    def pool_story(future):
+        if not future.exception() and future.result():
+            store_story(speculation["key"], future.result())
+
+    speculation["future"].add_done_callback(pool_story)
+
+
+def stream_story(level, topic, style, model):
+    # Returns as soon as the first sentence has arrived. The session reads the
+    # rest of the story from the stream.
+    from schemas import Story
+    new_screen()
+    config, contents = get_story_request(level, topic, style)
+    stream = StoryStream(model, config, contents, config.response_schema)
+    with spinner("Generating story") as sp:
+        started = stream.wait_for_start()
+        if started:
+            sp.text = f"{stylize(Color.GREEN, 'Generating story:')} {stream.story_name}"
+            sp.green.ok("✔")
+            print()
+    if not started:
+        # Nothing usable arrived, so generate the story without streaming
+        return generate_story(level, topic, style, model), None
+    content = Story(story_name=stream.story_name, sentences=[])
+    content.sentences = stream.sentences
+    return content, stream
+
+
+def spinner(text):
+    # yaspin is loaded on first use to keep startup fast
+    from yaspin import yaspin
+    return yaspin(text=text)
 
 
 def answer_validation(answer, english):
@@ -517,104 +904,22 @@ def answer_validation(answer, english):
         return True
 
 
-def check_answer(sentence, answer, story, model):
+@span("check_answer")
+def check_answer(sentence, answer, context, model):
     print()
-    with yaspin(text="Checking answer") as sp:
-        if answer == sentence.english:
-            s = random.uniform(0.65, 1.35)
-            time.sleep(s)
-            feedback = Feedback(correct=True, feedback="")
-            sp.text = stylize(Color.GREEN, "Correct!", Style.BOLD)
-            sp.green.ok("✔")
-            return feedback
-        cached_answer = check_cache(sentence.id, answer)
-        if cached_answer:
-            s = random.uniform(0.65, 1.35)
-            time.sleep(s)
-            feedback = Feedback(correct=True, feedback="")
+    with spinner("Checking answer") as sp:
+        feedback = grade_answer(sentence, answer, context, model, sp.write)
+        if feedback.correct:
             sp.text = stylize(Color.GREEN, "Correct!", Style.BOLD)
             sp.green.ok("✔")
-            return feedback
-        system_instruction = f"""
-You are a German tutor. Your purpose is to check the user's translation of a sentence.
-Provide friendly feedback in English (max 25 words) if the translation is incorrect.
-Do not provide direct translations in the feedback."""
-        config = types.GenerateContentConfig(
-            system_instruction=system_instruction,
-            response_mime_type="application/json",
-            response_schema=Feedback,
-        )
-        contents = f"I am translating this story sentence-by-sentence:\n\n{story}\n\nHere is the sentence I am attempting to translate: {sentence.german}.\nHere is my translation: {answer}\nPlease check my translation and give me your feedback."
-        validated = False
-        retry_count = 0
-        delay = INITIAL_DELAY_SECONDS
-        while not validated and retry_count < MAX_RETRIES:
-            gemini_response = get_gemini_response(model, config, contents)
-            feedback: Feedback = gemini_response.parsed
-            if isinstance(feedback, Feedback):
-                validated = True
-                if feedback.correct:
-                    save_answer(sentence.id, answer)
-                    sp.text = stylize(Color.GREEN, "Correct!", Style.BOLD)
-                    sp.green.ok("✔")
-                else:
-                    sp.text = stylize(Color.RED, "Incorrect.", Style.BOLD)
-                    sp.red.fail("✘")
-            else:
-                retry_count += 1
-                if retry_count < MAX_RETRIES:
-                    sp.write(f"The Gemini response is invalid. Retrying in {delay} seconds... (Attempt {retry_count}/{MAX_RETRIES})\n")
-                    time.sleep(delay)
-                    delay *= 2
-                else:
-                    sp.write(f"The Gemini response is invalid. Maximum retries reached.")
-                    sp.red.fail("✘")
-
-    if not validated:
-        print("Gemini response was invalid after multiple attempts. Exiting.")
-        sys.exit(1)
-
+        else:
+            sp.text = stylize(Color.RED, "Incorrect.", Style.BOLD)
+            sp.red.fail("✘")
     return feedback
 
 
-def get_gemini_response(model, config, contents):
-    global api_key
-    client = genai.Client(api_key=api_key)
-    gemini_success = False
-    retry_count = 0
-    delay = INITIAL_DELAY_SECONDS
-
-    while not gemini_success and retry_count < MAX_RETRIES:
-        try:
-            response = client.models.generate_content(
-                model=model,
-                config=config,
-                contents=contents,
-            )
-            gemini_success = True
-
-        except Exception as e:
-            retry_count += 1
-            error_code = getattr(e, 'code', None)
-
-            if error_code in [429, 500, 503, 504]:
-                if retry_count < MAX_RETRIES:
-                    print(f" Gemini error (Code: {error_code}). Retrying in {delay} seconds... (Attempt {retry_count}/{MAX_RETRIES})\n")
-                    time.sleep(delay)
-                    delay *= 2
-                else:
-                    print(f" Gemini error (Code: {error_code}). Maximum retries reached.")
-            else:
-                print(f" An unrecoverable error occurred: {str(e)}")
-                print("Exiting. Goodbye!")
-                sys.exit(1)
-
-    if not gemini_success:
-        print(" Gemini failed to respond after multiple attempts. Exiting.")
-        sys.exit(1)
-
-    return response
-
-
 if __name__ == "__main__":
-    main()
+    if profiling_requested():
+        run_profiled(main)
+    else:
+        main()
@@ -0,0 +1,96 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from db import add_pool_story, take_pool_story, count_pool_stories, record_pool_result, load_pool_stats
+from generation import request_story
+
+
+# Story pool config. Stories are pooled per (level, topic, style, model).
+DEFAULT_POOL_SIZE = 2
+DEFAULT_POOL_LEVELS = ["complete beginner", "A1", "A2", "B1", "B2", "C1", "C2"]
+DEFAULT_POOL_MODELS = "gemini-2.5-flash"
+POOL_WORKERS = 4
+
+
+def get_pool_size():
+    return int(os.environ.get("KUMPEL_POOL_SIZE", DEFAULT_POOL_SIZE))
+
+
+def get_pool_keys():
+    # The default choices for every level and pooled model, plus any other
+    # choices learners have asked for more than once.
+    levels = os.environ.get("KUMPEL_POOL_LEVELS")
+    levels = levels.split(",") if levels else DEFAULT_POOL_LEVELS
+    models = os.environ.get("KUMPEL_POOL_MODELS", DEFAULT_POOL_MODELS).split(",")
+    keys = [(level.strip(), None, None, model.strip()) for level in levels for model in models]
+    for pool_stat in load_pool_stats():
+        key = (pool_stat["level"], pool_stat["topic"], pool_stat["style"], pool_stat["model"])
+        if key not in keys and pool_stat["misses"] > 1:
+            keys.append(key)
+    return keys
+
+
+def store_story(key, story):
+    level, topic, style, model = key
+    add_pool_story(level, topic, style, model, story.model_dump_json())
+
+
+def parse_story(content):
+    # Stories generated with reference translations keep their paraphrases
+    from schemas import Story, ReferenceStory
+    sentences = json.loads(content)["sentences"]
+    if sentences and "paraphrases" in sentences[0]:
+        return ReferenceStory.model_validate_json(content)
+    return Story.model_validate_json(content)
+
+
+def generate_pool_story(key):
+    level, topic, style, model = key
+    story = request_story(level, topic, style, model, lambda message: None)
+    if story:
+        store_story(key, story)
+    return story is not None
+
+
+def take_story(key):
+    # Returns a pooled story, or None. Its replacement is generated by the
+    # next --refill-pool run, as a session can end before a background
+    # request would finish.
+    level, topic, style, model = key
+    pool_story = take_pool_story(level, topic, style, model)
+    record_pool_result(level, topic, style, model, pool_story is not None)
+    if not pool_story:
+        return None
+    return parse_story(pool_story["content"])
+
+
+def refill_pool(keys=None, size=None, workers=POOL_WORKERS):
+    # Tops up every key to the pool size. Requests go through the shared rate
+    # limiter, so the workers never exceed the models' budgets.
+    if keys is None:
+        keys = get_pool_keys()
+    if size is None:
+        size = get_pool_size()
+    jobs = []
+    for key in keys:
+        level, topic, style, model = key
+        jobs += [key] * max(0, size - count_pool_stories(level, topic, style, model))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(generate_pool_story, jobs))
+    return dict(requested=len(jobs), generated=sum(results))
+
+
+def get_pool_report():
+    lines = []
+    total_hits = 0
+    total_misses = 0
+    for pool_stat in load_pool_stats():
+        total_hits += pool_stat["hits"]
+        total_misses += pool_stat["misses"]
+        topic = "Custom" if pool_stat["topic"] else "None"
+        style = "Custom" if pool_stat["style"] else "None"
+        lines.append(f"{pool_stat['level']}, topic: {topic}, style: {style}, {pool_stat['model']}: {pool_stat['ready']} ready, {pool_stat['hits']} hits, {pool_stat['misses']} misses")
+    requests = total_hits + total_misses
+    hit_rate = total_hits / requests if requests else 0.0
+    lines.append(f"Pool hit rate: {hit_rate:.0%} ({total_hits}/{requests})")
+    return "\n".join(lines)
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import threading
+import functools
+
+
+# Profiling output, written with KUMPEL_PROFILE=1. The trace uses the Chrome
+# trace event format, which chrome://tracing, Perfetto and speedscope open.
+PROFILE_PATH = "kumpel.prof"
+TRACE_PATH = "kumpel-trace.json"
+
+
+enabled = False
+trace_events = []
+trace_start = time.perf_counter()
+
+
+def profiling_requested():
+    return bool(os.environ.get("KUMPEL_PROFILE"))
+
+
+class span:
+    # Times a phase of the session, as a context manager or a decorator.
+    # Does nothing unless profiling is running.
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if enabled:
+            trace_events.append(dict(
+                name=self.name,
+                ph="X",
+                ts=(self.start - trace_start) * 1_000_000,
+                dur=(time.perf_counter() - self.start) * 1_000_000,
+                pid=os.getpid(),
+                tid=threading.get_ident(),
+            ))
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with span(self.name):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+def write_trace(path=TRACE_PATH):
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    events = list(trace_events)
+    for tid in {event["tid"] for event in events}:
+        name = thread_names.get(tid, f"Thread {tid}")
+        events.append(dict(name="thread_name", ph="M", pid=os.getpid(), tid=tid, args=dict(name=name)))
+    with open(path, "w") as trace:
+        json.dump(dict(traceEvents=events, displayTimeUnit="ms"), trace)
+
+
+def summarize_trace():
+    # Total seconds per span name
+    totals = {}
+    for event in trace_events:
+        totals[event["name"]] = totals.get(event["name"], 0.0) + event["dur"] / 1_000_000
+    return totals
+
+
+def run_profiled(function, profile_path=PROFILE_PATH, trace_path=TRACE_PATH):
+    # Runs the function under cProfile and records spans, then writes the
+    # profile and the trace even if the function exits early.
+    import cProfile
+    global enabled
+    enabled = True
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        enabled = False
+        profiler.dump_stats(profile_path)
+        write_trace(trace_path)
+        totals = summarize_trace()
+        print(f"Profile written to {profile_path}, trace written to {trace_path}")
+        for name, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+            print(f"  {name}: {seconds:.3f}s")
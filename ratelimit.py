@@ -0,0 +1,149 @@
+import os
+import time
+import sqlite3
+import threading
+from db import load_rate_limits, save_rate_limit
+
+
+# Paid tier 1 rate limits per model: requests and tokens per minute.
+# Lower them for the free tier with e.g. KUMPEL_RATE_LIMITS="gemini-2.5-flash=10/250000"
+# or switch the limiter off with KUMPEL_RATE_LIMITS=off.
+RATE_LIMITS = {
+    "gemini-2.5-pro": (150, 2_000_000),
+    "gemini-2.5-flash": (1_000, 1_000_000),
+    "gemini-2.5-flash-lite": (4_000, 4_000_000),
+}
+
+
+# Rough prompt size estimate used before the real token count is known
+CHARACTERS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    # Tokens refill continuously up to the per-minute budget. Callers reserve
+    # tokens up front, so the balance can go negative and later callers wait
+    # for the deficit to refill.
+
+    def __init__(self, per_minute, level=None, updated_at=None):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute if level is None else level
+        self.updated_at = time.time() if updated_at is None else updated_at
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount, now):
+        self.refill(now)
+        self.level -= min(amount, self.capacity)
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.rate
+
+    def drain(self, now):
+        self.refill(now)
+        self.level = min(self.level, 0)
+
+
+buckets = {}
+bucket_lock = threading.Lock()
+limiter_stats = dict(waits=0, wait_seconds=0.0)
+
+
+def get_rate_limits():
+    setting = os.environ.get("KUMPEL_RATE_LIMITS")
+    if setting == "off":
+        return {}
+    limits = dict(RATE_LIMITS)
+    if setting:
+        for item in setting.split(","):
+            model, budget = item.strip().split("=")
+            rpm, tpm = budget.split("/")
+            limits[model] = (int(rpm), int(tpm))
+    return limits
+
+
+def persist_state():
+    return bool(os.environ.get("KUMPEL_RATE_LIMIT_STATE"))
+
+
+def get_buckets(model):
+    # Returns the (requests, tokens) buckets of the model, or None if unlimited
+    if model not in buckets:
+        limits = get_rate_limits()
+        if model not in limits:
+            return None
+        rpm, tpm = limits[model]
+        saved = {}
+        if persist_state():
+            try:
+                saved = {row["model"]: row for row in load_rate_limits()}
+            except sqlite3.Error as e:
+                # Starts with a full budget, e.g. when the database is locked
+                if os.environ.get("KUMPEL_TIMINGS"):
+                    print(f" Rate limits not loaded: {str(e)}")
+        if model in saved:
+            row = saved[model]
+            buckets[model] = (
+                TokenBucket(rpm, row["requests"], row["updated_at"]),
+                TokenBucket(tpm, row["tokens"], row["updated_at"]),
+            )
+        else:
+            buckets[model] = (TokenBucket(rpm), TokenBucket(tpm))
+    return buckets[model]
+
+
+def save_buckets(model):
+    if persist_state():
+        requests, tokens = buckets[model]
+        try:
+            save_rate_limit(model, requests.level, tokens.level, requests.updated_at)
+        except sqlite3.Error as e:
+            # The limiter never ends a request, e.g. when the database is locked
+            if os.environ.get("KUMPEL_TIMINGS"):
+                print(f" Rate limits not saved: {str(e)}")
+
+
+def estimate_tokens(contents):
+    return len(str(contents)) // CHARACTERS_PER_TOKEN + 1
+
+
+def acquire(model, tokens):
+    # Reserves one request and the estimated tokens, then sleeps until both
+    # fit in the model's budget. Returns the time spent waiting.
+    with bucket_lock:
+        model_buckets = get_buckets(model)
+        if model_buckets is None:
+            return 0.0
+        requests, token_bucket = model_buckets
+        now = time.time()
+        wait = max(requests.reserve(1, now), token_bucket.reserve(tokens, now))
+        save_buckets(model)
+        if wait > 0:
+            limiter_stats["waits"] += 1
+            limiter_stats["wait_seconds"] += wait
+    if wait > 0:
+        time.sleep(wait)
+    return wait
+
+
+def settle(model, estimated_tokens, actual_tokens):
+    # Corrects the token reservation once the real usage is known
+    with bucket_lock:
+        model_buckets = get_buckets(model)
+        if model_buckets is None or not actual_tokens:
+            return
+        token_bucket = model_buckets[1]
+        token_bucket.level = min(token_bucket.capacity, token_bucket.level + estimated_tokens - actual_tokens)
+        save_buckets(model)
+
+
+def penalize(model):
+    # A 429 means the server side budget is spent, whatever our buckets say
+    with bucket_lock:
+        model_buckets = get_buckets(model)
+        if model_buckets is None:
+            return
+        model_buckets[0].drain(time.time())
+        save_buckets(model)
@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import hashlib
+from db import load_response, save_response
+from llm import get_gemini_response, save_call, count_sentences, using_cassette
+
+
+# Response cache config. Identical requests are answered from the database
+# until the response expires. Switch the cache off with
+# KUMPEL_RESPONSE_CACHE=off to get a fresh response every time.
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+RESPONSE_CACHE_SIZE = 1000
+
+
+response_cache_stats = dict(hits=0, misses=0)
+
+
+def response_cache_enabled():
+    return os.environ.get("KUMPEL_RESPONSE_CACHE") != "off" and not using_cassette()
+
+
+def get_response_cache_ttl():
+    return int(os.environ.get("KUMPEL_RESPONSE_CACHE_TTL", RESPONSE_CACHE_TTL_SECONDS))
+
+
+def get_response_cache_size():
+    return int(os.environ.get("KUMPEL_RESPONSE_CACHE_SIZE", RESPONSE_CACHE_SIZE))
+
+
+def get_request_key(model, config, contents):
+    # Hashes everything which shapes the response
+    from pydantic import BaseModel
+    schema = config.response_schema
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        schema = schema.model_json_schema()
+    request = dict(
+        model=model,
+        system_instruction=config.system_instruction,
+        cached_content=config.cached_content,
+        schema=schema,
+        contents=contents,
+    )
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def lookup_response(model, config, contents):
+    # Returns the cached parsed response, or None
+    from pydantic import ValidationError
+    if not response_cache_enabled():
+        return None
+    response = load_response(get_request_key(model, config, contents), get_response_cache_ttl())
+    if response:
+        try:
+            parsed = config.response_schema.model_validate_json(response["content"])
+        except ValidationError:
+            parsed = None
+        if parsed is not None:
+            response_cache_stats["hits"] += 1
+            return parsed
+    response_cache_stats["misses"] += 1
+    return None
+
+
+def store_response(model, config, contents, parsed):
+    if response_cache_enabled():
+        key = get_request_key(model, config, contents)
+        save_response(key, model, parsed.model_dump_json(), get_response_cache_ttl(), get_response_cache_size())
+
+
+def get_parsed_response(model, config, contents, cache=True, refresh=False, purpose=None, sentences=None, session_mode=None, write=print):
+    # Returns the parsed response, or None if Gemini's response does not match
+    # the schema. refresh skips the lookup but still stores the new response,
+    # which replaces a cached response the caller has rejected.
+    if cache and not refresh:
+        start = time.perf_counter()
+        parsed = lookup_response(model, config, contents)
+        if parsed is not None:
+            if sentences is None:
+                sentences = count_sentences(parsed)
+            save_call(model, purpose, sentences, time.perf_counter() - start, cache_hit=True, session_mode=session_mode)
+            return parsed
+    parsed = get_gemini_response(model, config, contents, purpose, sentences, session_mode, write).parsed
+    if cache and isinstance(parsed, config.response_schema):
+        store_response(model, config, contents, parsed)
+    return parsed
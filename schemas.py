@@ -0,0 +1,70 @@
+from pydantic import BaseModel
+
+
+# Gemini response schema
+class StorySentence(BaseModel):
+    id: int
+    german: str
+    english: str
+
+
+# Gemini response schema
+class Story(BaseModel):
+    story_name: str
+    sentences: list[StorySentence]
+
+
+# Gemini response schema
+class Feedback(BaseModel):
+    correct: bool
+    feedback: str
+
+
+# Gemini response schema
+class ConfidentFeedback(Feedback):
+    confidence: float
+
+
+# Gemini response schema
+class ReferenceStorySentence(StorySentence):
+    paraphrases: list[str]
+    lemmas: list[str]
+
+
+# Gemini response schema
+class ReferenceStory(Story):
+    sentences: list[ReferenceStorySentence]
+
+
+# Gemini response schema
+class BatchFeedbackItem(Feedback):
+    index: int
+
+
+# Gemini response schema
+class BatchFeedback(BaseModel):
+    results: list[BatchFeedbackItem]
+
+
+def parse_story_sentences(name, sentences, references):
+    # Builds a Story from saved sentence and reference rows
+    content = Story(story_name=name, sentences=[])
+    for sen in sentences:
+        paraphrases = [ref["content"] for ref in references if ref["sentence_id"] == sen["id"] and ref["kind"] == "paraphrase"]
+        lemmas = [ref["content"] for ref in references if ref["sentence_id"] == sen["id"] and ref["kind"] == "lemma"]
+        if paraphrases or lemmas:
+            story_sentence = ReferenceStorySentence(
+                id=sen["id"],
+                german=sen["de"],
+                english=sen["en"],
+                paraphrases=paraphrases,
+                lemmas=lemmas
+            )
+        else:
+            story_sentence = StorySentence(
+                id=sen["id"],
+                german=sen["de"],
+                english=sen["en"]
+            )
+        content.sentences.append(story_sentence)
+    return content
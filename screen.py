@@ -0,0 +1,94 @@
+import sys
+import math
+import shutil
+import threading
+from ansitext import strip_ansi, move_cursor, clear_line, clear_below, clear_screen, set_scroll_region
+
+
+# Rows kept free below the fixed top of the screen for prompts and answers
+MIN_BODY_ROWS = 10
+
+
+def count_rows(line, width):
+    # Rows a line takes up once the terminal wraps it
+    return max(1, math.ceil(len(strip_ansi(line)) / width))
+
+
+class HeldMessages:
+    # Holds back messages from work running in the background until show is
+    # called, e.g. with a spinner's write, so they never print over a prompt.
+
+    def __init__(self):
+        self.messages = []
+        self.output = self.messages.append
+        self.lock = threading.Lock()
+
+    def write(self, message):
+        with self.lock:
+            self.output(message)
+
+    def show(self, write):
+        # Writes the held messages and any later ones with write
+        with self.lock:
+            for message in self.messages:
+                write(message)
+            self.messages = []
+            self.output = write
+
+
+class Screen:
+    # Keeps the header and progress lines fixed at the top of the terminal and
+    # lets prompts scroll in the region below. Each frame only rewrites the
+    # top lines which changed since the last frame.
+
+    def __init__(self, output=None):
+        self.output = output
+        self.lines = None
+        self.size = None
+
+    def write(self, content):
+        output = self.output or sys.stdout
+        output.write(content)
+        output.flush()
+
+    def render(self, lines):
+        # Draws a new frame with the given top lines and an empty body
+        size = shutil.get_terminal_size()
+        width, height = size
+        rows = [count_rows(line, width) for line in lines]
+        top_rows = sum(rows)
+        if top_rows + MIN_BODY_ROWS > height:
+            # Too tall to keep fixed, so the whole frame scrolls as one
+            self.write(set_scroll_region() + clear_screen() + "".join(line + "\n" for line in lines))
+            self.lines = None
+            return
+        frame = set_scroll_region(top_rows + 1, height)
+        if self.lines is None or size != self.size:
+            frame += clear_screen()
+            previous = []
+        else:
+            previous = self.lines
+        drawn = []
+        row = 1
+        for index, line in enumerate(lines):
+            if index >= len(previous) or previous[index] != (line, row):
+                frame += move_cursor(row) + line + clear_line()
+            drawn.append((line, row))
+            row += rows[index]
+        frame += move_cursor(top_rows + 1) + clear_below()
+        self.write(frame)
+        self.lines = drawn
+        self.size = size
+
+    def get_max_lines(self):
+        # Top lines which fit above the body, before any wrapping
+        return shutil.get_terminal_size().lines - MIN_BODY_ROWS
+
+    def clear(self):
+        self.write(set_scroll_region() + clear_screen())
+        self.lines = None
+
+    def close(self):
+        # Lets the whole terminal scroll again without clearing the screen
+        self.write(set_scroll_region() + move_cursor(shutil.get_terminal_size().lines))
+        self.lines = None
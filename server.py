@@ -0,0 +1,334 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from db import DB, init_db, upgrade_db, find_story, load_story_page, load_story, load_references, save_story
+from grading import cache_stats, grade_answer, get_story_context, get_sentence_context
+from generation import request_story
+from llm import set_api_key, needs_api_key, delete_cache
+from pool import take_story
+
+
+# Server config
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+SERVER_WORKERS = 16
+MAX_BODY_BYTES = 64 * 1024
+STORY_PAGE_SIZE = 20
+MAX_STORY_PAGE_SIZE = 100
+SESSION_TTL_SECONDS = 60 * 60
+MAX_SESSIONS = 1000
+SESSION_MODES = ["learn", "practice", "test"]
+MODELS = ["gemini-2.5-flash", "gemini-2.5-flash-lite", "gemini-2.5-pro"]
+LEVELS = ["complete beginner", "A1", "A2", "B1", "B2", "C1", "C2"]
+
+
+HTTP_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Session:
+    # Everything the CLI keeps in module globals, for one learner
+
+    def __init__(self, story, mode, story_context):
+        self.id = uuid.uuid4().hex
+        self.story = story
+        self.mode = mode
+        self.story_context = story_context
+        self.index = 0
+        self.progress = []
+        self.lock = asyncio.Lock()
+        self.used_at = time.monotonic()
+
+    def get_sentence(self):
+        sentences = self.story["content"].sentences
+        if self.index >= len(sentences):
+            return None
+        return sentences[self.index]
+
+    def to_json(self):
+        sentence = self.get_sentence()
+        return dict(
+            id=self.id,
+            story_id=self.story["id"],
+            story_name=self.story["content"].story_name,
+            mode=self.mode,
+            length=len(self.story["content"].sentences),
+            progress=self.progress,
+            german=sentence.german if sentence else None,
+            english=sentence.english if sentence and self.mode == "learn" else None,
+            done=sentence is None,
+        )
+
+
+class KumpelServer:
+    # A JSON API over asyncio streams. Blocking database and Gemini work runs
+    # in a thread pool, so all sessions share the SQLite caches, the rate
+    # limiter and the Gemini client.
+
+    def __init__(self, workers=SERVER_WORKERS):
+        # Sessions in order of last use, so the idle ones are evicted first
+        self.sessions = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def run_blocking(self, function, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        except SystemExit:
+            # get_gemini_response exits the CLI when Gemini keeps failing
+            raise HTTPError(502, "The LLM request failed.")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                status, payload = await self.respond(method, path, body)
+                content = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + content
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            # Malformed requests and dropped clients just close the connection
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, path, body):
+        # Returns the status and payload of a request. Errors are reported to
+        # the client instead of dropping the connection.
+        from pydantic import ValidationError
+        try:
+            return await self.route(method, path, parse_body(body))
+        except HTTPError as e:
+            return e.status, dict(error=e.message)
+        except (AttributeError, TypeError, ValidationError) as e:
+            # Request fields of the wrong type
+            return 400, dict(error=f"Invalid request: {str(e)}")
+        except Exception:
+            traceback.print_exc()
+            return 500, dict(error="Internal server error.")
+
+    async def read_request(self, reader):
+        # Returns (method, path, body, keep_alive), or None once the client
+        # has closed the connection. body is the raw request body.
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, version = request_line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, value = line.decode("latin-1").split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_BYTES:
+            raise ConnectionError("Request body too large")
+        body = await reader.readexactly(length) if length else None
+        keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+        return method, path, body, keep_alive
+
+    async def route(self, method, path, body):
+        url = urlsplit(path)
+        parts = [part for part in url.path.split("/") if part]
+        match parts:
+            case ["stories"] if method == "GET":
+                return 200, await self.list_stories(parse_qs(url.query))
+            case ["stats"] if method == "GET":
+                return 200, dict(answer_cache=cache_stats)
+            case ["sessions"] if method == "POST":
+                session = await self.start_session(body or {})
+                return 201, session.to_json()
+            case ["sessions", session_id] if method == "GET":
+                return 200, self.get_session(session_id).to_json()
+            case ["sessions", session_id] if method == "DELETE":
+                await self.release_cache(self.get_session(session_id))
+                self.sessions.pop(session_id, None)
+                return 200, dict(id=session_id)
+            case ["sessions", session_id, "answers"] if method == "POST":
+                return 200, await self.submit_answer(self.get_session(session_id), body or {})
+            case ["stories"] | ["stats"] | ["sessions"] | ["sessions", _] | ["sessions", _, "answers"]:
+                raise HTTPError(405, f"{method} is not allowed on {path}.")
+        raise HTTPError(404, f"{path} not found.")
+
+    async def list_stories(self, query):
+        # GET /stories?level=A1&model=gemini-2.5-flash&q=hund&after=40&limit=20
+        # returns a page of stories and the "after" value of the next page
+        try:
+            after_id = int(query.get("after", ["0"])[0])
+            limit = int(query.get("limit", [STORY_PAGE_SIZE])[0])
+        except ValueError:
+            raise HTTPError(400, "after and limit must be numbers.")
+        if not 1 <= limit <= MAX_STORY_PAGE_SIZE:
+            raise HTTPError(400, f"limit must be from 1 to {MAX_STORY_PAGE_SIZE}.")
+        filters = dict(level=query.get("level", [None])[0], model=query.get("model", [None])[0], search=query.get("q", [None])[0])
+        stories = await self.run_blocking(lambda: load_story_page(after_id, limit + 1, **filters))
+        next_after = stories[limit - 1]["id"] if len(stories) > limit else None
+        return dict(stories=stories[:limit], next=next_after)
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if not session:
+            raise HTTPError(404, "Session not found.")
+        session.used_at = time.monotonic()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    async def evict_sessions(self):
+        # Drops sessions idle for longer than SESSION_TTL_SECONDS and the
+        # least recently used ones beyond MAX_SESSIONS
+        expired_at = time.monotonic() - SESSION_TTL_SECONDS
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.used_at > expired_at and len(self.sessions) <= MAX_SESSIONS:
+                break
+            self.sessions.pop(session.id)
+            await self.release_cache(session)
+
+    async def start_session(self, body):
+        # Starts a session with a saved story ({"story_id": 1}) or a new one
+        # ({"level": "A1", "topic": null, "style": null, "model": "gemini-2.5-flash"})
+        mode = body.get("mode", "practice")
+        if mode not in SESSION_MODES:
+            raise HTTPError(400, f"mode must be one of {', '.join(SESSION_MODES)}.")
+        if "story_id" in body:
+            if not isinstance(body["story_id"], int):
+                raise HTTPError(400, "story_id must be a number.")
+            story = await self.run_blocking(load_saved_story, body["story_id"])
+        else:
+            level = body.get("level", "A1")
+            model = body.get("model", MODELS[0])
+            if level not in LEVELS or model not in MODELS:
+                raise HTTPError(400, f"level must be one of {', '.join(LEVELS)} and model one of {', '.join(MODELS)}.")
+            story = await self.run_blocking(create_story, level, body.get("topic"), body.get("style"), model)
+        story_context = await self.run_blocking(get_story_context, story, mode)
+        session = Session(story, mode, story_context)
+        self.sessions[session.id] = session
+        await self.evict_sessions()
+        return session
+
+    async def submit_answer(self, session, body):
+        # Grades the answer to the current sentence. Correct answers move the
+        # session on, and so does every answer in Test mode.
+        answer = body.get("answer")
+        if not isinstance(answer, str) or not answer.strip():
+            raise HTTPError(400, "answer must be a non-empty string.")
+        async with session.lock:
+            sentence = session.get_sentence()
+            if sentence is None:
+                raise HTTPError(400, "The session is finished.")
+            context = get_sentence_context(session.story_context, session.index)
+            feedback = await self.run_blocking(
+                grade_answer, sentence, answer, context, session.story["model"], lambda message: None
+            )
+            if feedback.correct:
+                session.progress.append(sentence.german)
+            if feedback.correct or session.mode == "test":
+                session.index += 1
+            if session.get_sentence() is None:
+                await self.release_cache(session)
+        result = dict(correct=feedback.correct, feedback=feedback.feedback if session.mode != "test" else None)
+        result.update(session=session.to_json())
+        return result
+
+    async def release_cache(self, session):
+        # Finished sessions stay readable until they are deleted, but their
+        # context cache is not needed any more
+        cache = session.story_context["cache"]
+        if cache:
+            session.story_context["cache"] = None
+            await self.run_blocking(delete_cache, cache)
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        if ready:
+            ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+
+def parse_body(body):
+    # Returns the JSON object of a request body, or None if there is no body
+    if body is None:
+        return None
+    try:
+        body = json.loads(body)
+    except ValueError:
+        raise HTTPError(400, "The request body must be JSON.")
+    if not isinstance(body, dict):
+        raise HTTPError(400, "The request body must be a JSON object.")
+    return body
+
+
+def load_saved_story(story_id):
+    from schemas import parse_story_sentences
+    story = find_story(story_id)
+    if not story:
+        raise HTTPError(404, "Story not found.")
+    story["content"] = parse_story_sentences(story["name"], load_story(story_id), load_references(story_id))
+    return story
+
+
+def create_story(level, topic, style, model):
+    # New stories are saved straight away so their sentences get real ids
+    # for the shared answer caches
+    content = take_story((level, topic, style, model))
+    if not content:
+        content = request_story(level, topic, style, model, lambda message: None)
+    if not content:
+        raise HTTPError(502, "Gemini did not return a valid story.")
+    story_id = save_story(dict(level=level, topic=topic, style=style, model=model, content=content))
+    return load_saved_story(story_id)
+
+
+def main():
+    from dotenv import load_dotenv
+    parser = argparse.ArgumentParser(description="Serve Kumpel sessions over a JSON API.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    args = parser.parse_args()
+    load_dotenv()
+    api_key = os.environ.get("KUMPEL_GEMINI_API_KEY")
+    if not api_key and needs_api_key():
+        raise ValueError("Missing API key. Add KUMPEL_GEMINI_API_KEY to kumpel/.env e.g. KUMPEL_GEMINI_API_KEY=your_api_key")
+    set_api_key(api_key)
+    if not os.path.exists(DB):
+        init_db()
+    upgrade_db()
+    print(f"Serving on http://{args.host}:{args.port}")
+    asyncio.run(KumpelServer(args.workers).serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from db import load_llm_calls
+
+
+STATS_HEADERS = ["Model", "Purpose", "Mode", "Calls", "Cache hits", "p50", "p95", "Retries", "Tokens/sentence", "Cost"]
+
+
+def get_percentile(values, percentile):
+    # Nearest rank percentile of a sorted list
+    if not values:
+        return None
+    rank = max(1, round(percentile / 100 * len(values)))
+    return values[rank - 1]
+
+
+def get_call_stats(llm_calls=None):
+    # One row per model, purpose and mode. Latency percentiles leave out
+    # calls answered by the response cache.
+    if llm_calls is None:
+        llm_calls = load_llm_calls()
+    groups = {}
+    for llm_call in llm_calls:
+        key = (llm_call["model"], llm_call["purpose"] or "", llm_call["mode"] or "")
+        groups.setdefault(key, []).append(llm_call)
+    stats = []
+    for (model, purpose, mode), group in sorted(groups.items()):
+        seconds = sorted(llm_call["seconds"] for llm_call in group if not llm_call["cache_hit"])
+        sentences = sum(llm_call["sentences"] for llm_call in group)
+        tokens = sum(llm_call["prompt_tokens"] + llm_call["response_tokens"] for llm_call in group)
+        stats.append(dict(
+            model=model,
+            purpose=purpose,
+            mode=mode,
+            calls=len(group),
+            cache_hits=sum(llm_call["cache_hit"] for llm_call in group),
+            p50=get_percentile(seconds, 50),
+            p95=get_percentile(seconds, 95),
+            retries=sum(llm_call["retries"] for llm_call in group),
+            tokens_per_sentence=tokens / sentences if sentences else None,
+            cost=sum(llm_call["cost"] for llm_call in group),
+        ))
+    return stats
+
+
+def format_call_stats(call_stats):
+    # Rows of text for a table with STATS_HEADERS
+    rows = []
+    for row in call_stats:
+        rows.append([
+            row["model"],
+            row["purpose"],
+            row["mode"],
+            str(row["calls"]),
+            str(row["cache_hits"]),
+            "-" if row["p50"] is None else f"{row['p50']:.2f}s",
+            "-" if row["p95"] is None else f"{row['p95']:.2f}s",
+            str(row["retries"]),
+            "-" if row["tokens_per_sentence"] is None else f"{row['tokens_per_sentence']:.0f}",
+            f"${row['cost']:.4f}",
+        ])
+    return rows
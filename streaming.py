@@ -0,0 +1,116 @@
+import re
+import json
+import typing
+import threading
+from llm import stream_gemini_response
+
+
+class StoryParser:
+    # Picks the story name and complete sentence objects out of a partial
+    # JSON story as it streams in.
+
+    def __init__(self):
+        self.text = ""
+        self.story_name = None
+        self.position = None
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self.story_name is None:
+            match = re.search(r'"story_name"\s*:\s*("(?:[^"\\]|\\.)*")', self.text)
+            if match:
+                self.story_name = json.loads(match.group(1))
+        if self.position is None:
+            match = re.search(r'"sentences"\s*:\s*\[', self.text)
+            if match:
+                self.position = match.end()
+        items = []
+        while self.position is not None:
+            position = self.position
+            while position < len(self.text) and self.text[position] in " \t\r\n,":
+                position += 1
+            if position >= len(self.text) or self.text[position] == "]":
+                break
+            try:
+                item, end = self.decoder.raw_decode(self.text, position)
+            except json.JSONDecodeError:
+                break
+            items.append(item)
+            self.position = end
+        return items
+
+
+class StoryStream:
+    # Generates a story in a background thread. Sentences can be read with a
+    # blocking iterator while the rest of the story is still being generated.
+
+    def __init__(self, model, config, contents, response_schema):
+        self.model = model
+        self.config = config
+        self.contents = contents
+        self.response_schema = response_schema
+        self.sentence_schema = typing.get_args(response_schema.model_fields["sentences"].annotation)[0]
+        self.story_name = None
+        self.sentences = []
+        self.story = None
+        self.error = None
+        self.done = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        parser = StoryParser()
+        story = None
+        error = None
+        try:
+            for chunk in stream_gemini_response(self.model, self.config, self.contents, "generate"):
+                sentences = [self.sentence_schema.model_validate(item) for item in parser.feed(chunk)]
+                with self.condition:
+                    self.story_name = parser.story_name
+                    self.sentences.extend(sentences)
+                    self.condition.notify_all()
+            story = self.response_schema.model_validate_json(parser.text)
+        except Exception as e:
+            error = e
+        with self.condition:
+            if story:
+                self.story_name = story.story_name
+                self.sentences.extend(story.sentences[len(self.sentences):])
+            self.story = story
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def wait_for_start(self):
+        # Returns True once the name and first sentence are available
+        with self.condition:
+            while not self.done and (self.story_name is None or not self.sentences):
+                self.condition.wait()
+            return self.story_name is not None and len(self.sentences) > 0
+
+    def wait(self):
+        with self.condition:
+            while not self.done:
+                self.condition.wait()
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.sentences) and not self.done:
+                    self.condition.wait()
+                if index >= len(self.sentences):
+                    return
+                sentence = self.sentences[index]
+            yield sentence
+            index += 1
+
+    def result(self):
+        # Returns the validated story, or the sentences received before the
+        # stream broke off.
+        self.wait()
+        if self.story:
+            return self.response_schema(story_name=self.story.story_name, sentences=self.sentences)
+        return self.response_schema(story_name=self.story_name or "", sentences=self.sentences)
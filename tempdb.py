@@ -0,0 +1,29 @@
+import os
+import unittest
+import tempfile
+import db
+from db import init_db, close_db
+
+
+def use_temp_db(test):
+    # Points db.DB at a new database for the length of the test and removes
+    # it with its WAL files afterwards
+    db_fd, db_path = tempfile.mkstemp()
+    original_db = db.DB
+    db.DB = db_path
+    init_db()
+
+    def remove_db():
+        close_db()
+        db.DB = original_db
+        os.close(db_fd)
+        for path in [db_path, db_path + "-wal", db_path + "-shm"]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    test.addCleanup(remove_db)
+
+
+class TempDBTestCase(unittest.TestCase):
+    def setUp(self):
+        use_temp_db(self)
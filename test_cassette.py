@@ -0,0 +1,72 @@
+import os
+import unittest
+import tempfile
+from unittest import mock
+from cassette import RecordingBackend, ReplayBackend, CassetteMiss, get_cassette_key, summarize_cassette
+from fakebackend import FakeBackend
+from generation import get_story_request
+from grading import get_grading_request, lookup_answer
+from responsecache import lookup_response
+from schemas import StorySentence
+
+
+class TestCassette(unittest.TestCase):
+    def setUp(self):
+        self.cassette_fd, self.cassette_path = tempfile.mkstemp(suffix=".jsonl")
+        self.story_request = get_story_request("A1", None, None)
+        sentence = StorySentence(id=1, german="Der Hund läuft nach Hause.", english="The dog runs home.")
+        context = dict(mode="window", cache=None, text=sentence.german)
+        self.grading_request = get_grading_request(sentence, "The dog runs home.", context)
+
+    def tearDown(self):
+        os.close(self.cassette_fd)
+        os.unlink(self.cassette_path)
+
+    def test_record_and_replay(self):
+        recorder = RecordingBackend(FakeBackend(latency=0, story_sentences=3, seed=1), self.cassette_path)
+        story = recorder.generate_content("gemini-2.5-flash", *self.story_request).parsed
+        chunks = [chunk.text for chunk in recorder.generate_content_stream("gemini-2.5-flash", *self.story_request)]
+        feedbacks = [recorder.generate_content("gemini-2.5-flash", *self.grading_request).parsed for _ in range(3)]
+
+        replay = ReplayBackend(self.cassette_path)
+        response = replay.generate_content("gemini-2.5-flash", *self.story_request)
+        self.assertEqual(response.parsed, story)
+        self.assertEqual(response.usage_metadata.prompt_token_count, len(str(self.story_request[1])) // 4 + 1)
+        self.assertEqual([chunk.text for chunk in replay.generate_content_stream("gemini-2.5-flash", *self.story_request)], chunks)
+        replayed = [replay.generate_content("gemini-2.5-flash", *self.grading_request).parsed for _ in range(4)]
+        self.assertEqual(replayed, feedbacks + feedbacks[-1:])
+
+    def test_miss(self):
+        RecordingBackend(FakeBackend(latency=0, seed=1), self.cassette_path).generate_content("gemini-2.5-flash", *self.story_request)
+        replay = ReplayBackend(self.cassette_path)
+        with self.assertRaises(CassetteMiss):
+            replay.generate_content("gemini-2.5-pro", *self.story_request)
+
+    def test_key(self):
+        # Context cache names change every run
+        config, contents = self.grading_request
+        cached = config.model_copy(update=dict(cached_content="cachedContents/run-1"))
+        key = get_cassette_key("gemini-2.5-flash", cached, contents)
+        self.assertEqual(key, get_cassette_key("gemini-2.5-flash", cached.model_copy(update=dict(cached_content="cachedContents/run-2")), contents))
+        self.assertNotEqual(key, get_cassette_key("gemini-2.5-flash", config, contents))
+
+    @mock.patch("grading.check_cache")
+    @mock.patch("responsecache.load_response")
+    def test_caches_are_bypassed(self, load_response, check_cache):
+        sentence = StorySentence(id=1, german="Der Hund läuft nach Hause.", english="The dog runs home.")
+        with mock.patch.dict(os.environ, {"KUMPEL_CASSETTE": self.cassette_path}):
+            self.assertIsNone(lookup_response("gemini-2.5-flash", *self.grading_request))
+            self.assertIsNone(lookup_answer(sentence, "The dog goes home."))
+        load_response.assert_not_called()
+        check_cache.assert_not_called()
+
+    def test_summary(self):
+        recorder = RecordingBackend(FakeBackend(latency=0, seed=1), self.cassette_path)
+        recorder.generate_content("gemini-2.5-flash", *self.story_request)
+        recorder.generate_content("gemini-2.5-flash", *self.grading_request)
+        summary = summarize_cassette(self.cassette_path)
+        self.assertEqual(summary["gemini-2.5-flash"]["calls"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import db
+from db import save_story
+from checkpoint import start_checkpoint, checkpoint_content, checkpoint_mode, checkpoint_progress, finish_checkpoint, load_checkpoint
+from schemas import Story, StorySentence, ReferenceStory, ReferenceStorySentence
+from tempdb import TempDBTestCase
+
+
+class TestCheckpoint(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        sentences = [
+            StorySentence(id=1, german="Der Hund läuft.", english="The dog runs."),
+            StorySentence(id=2, german="Die Katze schläft.", english="The cat sleeps."),
+            StorySentence(id=3, german="Es regnet.", english="It is raining."),
+        ]
+        content = Story(story_name="Test Story", sentences=sentences)
+        self.story = dict(id=None, level="A1", topic="Pets", style=None, model="gemini-2.5-flash", content=content, stream=None)
+
+    def test_resume_generated_story(self):
+        self.assertIsNone(load_checkpoint())
+        start_checkpoint(self.story)
+        checkpoint_mode(self.story, "test")
+        checkpoint_progress(self.story, 2)
+        checkpoint_progress(self.story, 0)
+        story = load_checkpoint()
+        self.assertEqual(story["content"], self.story["content"])
+        self.assertEqual((story["id"], story["topic"], story["mode"]), (None, "Pets", "test"))
+        self.assertEqual(story["passed"], [2, 0])
+        self.assertEqual(story["session"], self.story["session"])
+
+    def test_resume_saved_story(self):
+        self.story["id"] = save_story(self.story)
+        start_checkpoint(self.story)
+        story = load_checkpoint()
+        self.assertEqual(story["id"], self.story["id"])
+        self.assertEqual([sentence.german for sentence in story["content"].sentences], [sentence.german for sentence in self.story["content"].sentences])
+        self.assertIsNone(story["mode"])
+        self.assertEqual(story["passed"], [])
+
+    def test_reference_story(self):
+        sentence = ReferenceStorySentence(id=1, german="Hallo!", english="Hello!", paraphrases=["Hi!"], lemmas=["hallo"])
+        self.story["content"] = ReferenceStory(story_name="Test Story", sentences=[sentence])
+        start_checkpoint(self.story)
+        self.assertEqual(load_checkpoint()["content"].sentences[0].paraphrases, ["Hi!"])
+
+    def test_streamed_story(self):
+        # Not resumable until the stream has finished
+        self.story["stream"] = object()
+        start_checkpoint(self.story)
+        self.assertIsNone(load_checkpoint())
+        checkpoint_content(self.story)
+        self.assertEqual(load_checkpoint()["content"], self.story["content"])
+
+    def test_finished_session(self):
+        start_checkpoint(self.story)
+        checkpoint_progress(self.story, 0)
+        finish_checkpoint(self.story)
+        self.assertIsNone(load_checkpoint())
+        # Finished sessions are cleared when the next one starts
+        start_checkpoint(dict(self.story))
+        rows = db.get_db().execute("SELECT count(*) AS count FROM session_progress").fetchone()
+        self.assertEqual(rows["count"], 0)
+
+    def test_abandoned_session(self):
+        # An unfinished session is replaced when a new one starts
+        start_checkpoint(self.story)
+        checkpoint_progress(self.story, 0)
+        story = dict(self.story)
+        start_checkpoint(story)
+        self.assertEqual(load_checkpoint()["session"], story["session"])
+        rows = db.get_db().execute("SELECT count(*) AS count FROM session").fetchone()
+        self.assertEqual(rows["count"], 1)
+        rows = db.get_db().execute("SELECT count(*) AS count FROM session_progress").fetchone()
+        self.assertEqual(rows["count"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,20 +1,172 @@
-import unittest
-import tempfile
-from db import init_db, get_db, save_story
-from main import Story, StorySentence 
+import sqlite3
+from unittest import mock
+import db
+from db import init_db, get_db, close_db, save_story, save_answer, check_cache, load_answers, save_incorrect_answer, check_incorrect_cache, load_story, load_references, save_sentence, find_story, load_story_page
+from schemas import Story, StorySentence, ReferenceStorySentence
+from tempdb import TempDBTestCase
 
 
-class TestDB(unittest.TestCase):
-    def setUp():
-        db_fd, db_path = tempfile.mkstemp()
-        init_db("db_path")
-
-    def tearDown():
-        os.close(db_fd)
-        os.unlink(db_path)
+class TestDB(TempDBTestCase):
     def test_save_story(self):
         sentences = [StorySentence(id=1, german="Hallo!", english="Hello!")]
         story_name = "Test Story"
         story_content = Story(story_name=story_name, sentences=sentences)
         story = dict(content=story_content, level=1, topic=None, style=None, model="gemini-2.5-flash-lite")
         save_story(story)
+
+    def test_save_story_references(self):
+        sentences = [ReferenceStorySentence(id=1, german="Hallo!", english="Hello!", paraphrases=["Hi!"], lemmas=["hello"])]
+        story_content = Story(story_name="Test Story", sentences=sentences)
+        story = dict(content=story_content, level="A1", topic=None, style=None, model="gemini-2.5-flash-lite")
+        save_story(story)
+        sentence_id = load_story(1)[0]["id"]
+        references = load_references(1)
+        self.assertEqual(references, [
+            dict(sentence_id=sentence_id, kind="paraphrase", content="Hi!"),
+            dict(sentence_id=sentence_id, kind="lemma", content="hello"),
+        ])
+
+    def test_check_cache_normalized(self):
+        save_answer(1, "The dog doesn't run.")
+        self.assertTrue(check_cache(1, "the dog does not run"))
+        self.assertTrue(check_cache(1, "  The  dog doesn’t run! "))
+        self.assertFalse(check_cache(1, "The dog runs."))
+        self.assertFalse(check_cache(2, "The dog doesn't run."))
+        self.assertEqual(load_answers(1), ["The dog doesn't run."])
+
+    def test_incorrect_cache(self):
+        save_incorrect_answer(1, "The cat runs.", "Check the animal.")
+        self.assertEqual(check_incorrect_cache(1, "the cat runs")["feedback"], "Check the animal.")
+        save_answer(1, "The cat runs.")
+        self.assertIsNone(check_incorrect_cache(1, "The cat runs."))
+
+    def test_incorrect_cache_eviction(self):
+        for i in range(db.INCORRECT_ANSWERS_PER_SENTENCE + 1):
+            save_incorrect_answer(1, f"Answer {i}", "Try again.")
+        self.assertIsNone(check_incorrect_cache(1, "Answer 0"))
+        self.assertIsNotNone(check_incorrect_cache(1, "Answer 1"))
+        connection = get_db()
+        connection.execute("UPDATE incorrect_answer SET created_at = 0")
+        connection.commit()
+        self.assertIsNone(check_incorrect_cache(1, "Answer 1"))
+
+    def test_cache_lookup_uses_index(self):
+        plan = get_db().execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM answer WHERE sentence_id = ? AND normalized = ?",
+            (1, "hello")
+        ).fetchall()
+        self.assertIn("USING COVERING INDEX answer_sentence_normalized", plan[0]["detail"])
+
+    def test_shared_sentences(self):
+        first = Story(story_name="First", sentences=[
+            StorySentence(id=1, german="Hallo!", english="Hello!"),
+            StorySentence(id=2, german="Der Hund läuft.", english="The dog runs."),
+        ])
+        second = Story(story_name="Second", sentences=[
+            StorySentence(id=1, german="Es regnet.", english="It is raining."),
+            StorySentence(id=2, german="Hallo!", english="Hello!"),
+        ])
+        first_id = save_story(dict(content=first, level="A1", topic=None, style=None, model="gemini-2.5-flash"))
+        second_id = save_story(dict(content=second, level="A1", topic=None, style=None, model="gemini-2.5-flash"))
+        self.assertEqual([sentence["de"] for sentence in load_story(second_id)], ["Es regnet.", "Hallo!"])
+        save_answer(load_story(first_id)[0]["id"], "Hi!")
+        self.assertTrue(check_cache(load_story(second_id)[1]["id"], "hi"))
+        self.assertEqual(get_db().execute("SELECT count(*) AS count FROM sentence").fetchone()["count"], 3)
+        self.assertEqual(save_sentence("Hallo!", "Hello!"), load_story(first_id)[0]["id"])
+
+    def test_share_sentences_migration(self):
+        # Build the schema as it was before sentences were shared
+        close_db()
+        with mock.patch("db.MIGRATIONS", db.MIGRATIONS[:db.MIGRATIONS.index(db.share_sentences)]):
+            init_db()
+        connection = get_db()
+        connection.executescript("""
+INSERT INTO story (id, name, level, model) VALUES (1, 'First', 'A1', 'gemini-2.5-flash'), (2, 'Second', 'A1', 'gemini-2.5-flash');
+INSERT INTO sentence (id, story_id, de, en) VALUES (1, 1, 'Hallo!', 'Hello!'), (2, 1, 'Tschüss!', 'Bye!'), (3, 2, 'Hallo!', 'Hello!');
+INSERT INTO answer (sentence_id, content, normalized) VALUES (1, 'Hi!', 'hi'), (3, 'Hi!', 'hi'), (3, 'Hey!', 'hey'), (7, 'Orphan', 'orphan');
+INSERT INTO incorrect_answer (sentence_id, content, normalized, feedback, created_at) VALUES (8, 'Orphan', 'orphan', 'No.', 0);
+INSERT INTO reference (sentence_id, kind, content) VALUES (1, 'paraphrase', 'Hi!'), (3, 'paraphrase', 'Hi!');
+        """)
+        connection.commit()
+        db.upgrade_db()
+        self.assertEqual([sentence["id"] for sentence in load_story(1)], [1, 2])
+        self.assertEqual(load_story(2), [dict(id=1, de="Hallo!", en="Hello!")])
+        self.assertEqual(sorted(load_answers(1)), ["Hey!", "Hi!"])
+        # Answers to sentences which were never saved are dropped
+        self.assertEqual(load_answers(7), [])
+        self.assertEqual(get_db().execute("SELECT count(*) AS count FROM incorrect_answer").fetchone()["count"], 0)
+        self.assertEqual(load_references(2), [dict(sentence_id=1, kind="paraphrase", content="Hi!")])
+        self.assertEqual(get_db().execute("SELECT count(*) AS count FROM sentence").fetchone()["count"], 2)
+        self.assertEqual(save_sentence("Hallo!", "Hello!"), 1)
+        self.assertEqual([story["id"] for story in load_story_page(search="tschüss")], [1])
+        self.assertEqual(get_db().execute("PRAGMA user_version").fetchone()["user_version"], len(db.MIGRATIONS))
+
+    def test_story_pages(self):
+        for number in range(5):
+            sentences = [StorySentence(id=1, german=f"Der Hund Nummer {number} läuft.", english=f"Dog number {number} runs.")]
+            level = "A1" if number % 2 else "B1"
+            save_story(dict(content=Story(story_name=f"Story {number}", sentences=sentences), level=level, topic=None, style=None, model="gemini-2.5-flash"))
+        first = load_story_page(0, 2)
+        self.assertEqual([story["name"] for story in first], ["Story 0", "Story 1"])
+        second = load_story_page(first[-1]["id"], 2)
+        self.assertEqual([story["name"] for story in second], ["Story 2", "Story 3"])
+        self.assertEqual([story["name"] for story in load_story_page(0, 10, level="A1")], ["Story 1", "Story 3"])
+        self.assertEqual(load_story_page(0, 10, model="gemini-2.5-pro"), [])
+        self.assertEqual(find_story(second[0]["id"])["name"], "Story 2")
+        self.assertIsNone(find_story(100))
+        plan = get_db().execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM story WHERE id > 0 AND level = 'A1' AND model = 'gemini-2.5-flash' ORDER BY id"
+        ).fetchall()
+        self.assertIn("story_level_model", plan[0]["detail"])
+
+    def test_story_search(self):
+        sentences = [StorySentence(id=1, german="Die Katze läuft.", english="The cat runs.")]
+        save_story(dict(content=Story(story_name="Ein langer Tag", sentences=sentences), level="A1", topic=None, style=None, model="gemini-2.5-flash"))
+        # Sentences, story names, word prefixes and words without umlauts all match
+        for search in ["katze", "TAG", "lauft", "kat run", "läu"]:
+            self.assertEqual(len(load_story_page(0, 10, search=search)), 1, search)
+        for search in ["hund", "katze hund", '"', "tag OR"]:
+            self.assertEqual(load_story_page(0, 10, search=search), [], search)
+        self.assertEqual(len(load_story_page(0, 10, search="  ")), 1)
+
+    def test_failed_migration_is_rolled_back(self):
+        close_db()
+        with mock.patch("db.MIGRATIONS", db.MIGRATIONS[:db.MIGRATIONS.index(db.share_sentences)]):
+            init_db()
+        version = get_db().execute("PRAGMA user_version").fetchone()["user_version"]
+        with mock.patch("db.get_sentence_hash", side_effect=ValueError("crash")):
+            get_db().execute("INSERT INTO sentence (id, story_id, de, en) VALUES (1, 1, 'Hallo!', 'Hello!')")
+            get_db().commit()
+            with self.assertRaises(sqlite3.Error):
+                db.upgrade_db()
+        self.assertEqual(get_db().execute("PRAGMA user_version").fetchone()["user_version"], version)
+        # Nothing was left half applied, so the migration runs again
+        db.upgrade_db()
+        self.assertEqual(load_story(1), [dict(id=1, de="Hallo!", en="Hello!")])
+
+    def test_renormalize_answers(self):
+        close_db()
+        with mock.patch("db.MIGRATIONS", db.MIGRATIONS[:db.MIGRATIONS.index(db.renormalize_answers)]):
+            init_db()
+        sentence_id = save_sentence("Ich war gegangen.", "I had gone.")
+        get_db().execute("INSERT INTO answer (sentence_id, content, normalized) VALUES (?, 'I''d gone.', 'i would gone')", (sentence_id,))
+        get_db().commit()
+        db.upgrade_db()
+        self.assertTrue(check_cache(sentence_id, "I'd gone"))
+        self.assertFalse(check_cache(sentence_id, "I would gone"))
+
+    def test_every_migration_is_atomic(self):
+        # The ALTER of add_normalized_answers is rolled back with its UPDATE
+        close_db()
+        with mock.patch("db.MIGRATIONS", []):
+            init_db()
+        get_db().execute("INSERT INTO answer (sentence_id, content) VALUES (1, 'Hello!')")
+        get_db().commit()
+        with mock.patch("db.normalize_answer", side_effect=ValueError("crash")):
+            with self.assertRaises(sqlite3.Error):
+                db.upgrade_db()
+        self.assertEqual(get_db().execute("PRAGMA user_version").fetchone()["user_version"], 0)
+        columns = [column["name"] for column in get_db().execute("PRAGMA table_info(answer)")]
+        self.assertNotIn("normalized", columns)
+        db.upgrade_db()
+        self.assertEqual(get_db().execute("PRAGMA user_version").fetchone()["user_version"], len(db.MIGRATIONS))
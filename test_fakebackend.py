@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import unittest
+from unittest import mock
+import llm
+from db import load_llm_calls
+from llm import get_gemini_response, stream_gemini_response, set_backend
+from fakebackend import FakeBackend
+from generation import get_story_request
+from grading import get_grading_request, get_batch_grading_request
+from schemas import Story, StorySentence, Feedback, BatchFeedback
+from tempdb import TempDBTestCase
+
+
+@mock.patch.dict(os.environ, {"KUMPEL_RATE_LIMITS": "off"})
+class TestFakeBackend(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.context = dict(mode="window", cache=None, text="Der Hund läuft nach Hause.")
+        self.sentence = StorySentence(id=1, german="Der Hund läuft nach Hause.", english="The dog runs home.")
+
+    def tearDown(self):
+        set_backend(None)
+
+    def test_story(self):
+        set_backend(FakeBackend(latency=0, story_sentences=3, seed=1))
+        config, contents = get_story_request("A1", None, None)
+        story = get_gemini_response("gemini-2.5-flash", config, contents, "generate").parsed
+        self.assertIsInstance(story, Story)
+        self.assertEqual(len(story.sentences), 3)
+        llm_call = load_llm_calls()[0]
+        self.assertEqual((llm_call["purpose"], llm_call["sentences"], llm_call["retries"]), ("generate", 3, 0))
+        self.assertGreater(llm_call["cost"], 0)
+
+    def test_session_mode(self):
+        set_backend(FakeBackend(latency=0, seed=1))
+        config, contents = get_grading_request(self.sentence, "The dog runs home.", self.context)
+        get_gemini_response("gemini-2.5-flash", config, contents, "grade", 1, session_mode="practice")
+        get_gemini_response("gemini-2.5-flash", config, contents, "grade", 1, session_mode="test")
+        self.assertEqual([llm_call["mode"] for llm_call in load_llm_calls()], ["practice", "test"])
+
+    def test_telemetry_failure(self):
+        # A failed write to llm_call does not end the session
+        set_backend(FakeBackend(latency=0, seed=1))
+        config, contents = get_grading_request(self.sentence, "The dog runs home.", self.context)
+        with mock.patch("llm.save_llm_call", side_effect=sqlite3.OperationalError("database is locked")):
+            feedback = get_gemini_response("gemini-2.5-flash", config, contents, "grade", 1).parsed
+        self.assertIsInstance(feedback, Feedback)
+
+    def test_feedback(self):
+        set_backend(FakeBackend(latency=0, seed=1))
+        config, contents = get_grading_request(self.sentence, "The dog runs home.", self.context)
+        self.assertIsInstance(get_gemini_response("gemini-2.5-flash", config, contents).parsed, Feedback)
+        pairs = [(self.sentence, "The dog runs home.")] * 3
+        config, contents = get_batch_grading_request(pairs, self.context)
+        batch_feedback = get_gemini_response("gemini-2.5-flash", config, contents).parsed
+        self.assertIsInstance(batch_feedback, BatchFeedback)
+        self.assertEqual([result.index for result in batch_feedback.results], [0, 1, 2])
+
+    @mock.patch("llm.time.sleep")
+    def test_errors_are_retried(self, sleep):
+        set_backend(FakeBackend(latency=0, error_rate=1.0, error_codes=[503], retry_delay=2, seed=1))
+        config, contents = get_story_request("A1", None, None)
+        with mock.patch("builtins.print"):
+            with self.assertRaises(SystemExit):
+                get_gemini_response("gemini-2.5-flash", config, contents)
+        # The fake backend's own latency sleeps are zero
+        retry_delays = [call.args[0] for call in sleep.call_args_list if call.args[0] > 0]
+        self.assertEqual(len(retry_delays), llm.MAX_RETRIES - 1)
+        self.assertTrue(all(delay >= 2 for delay in retry_delays))
+
+    def test_invalid_responses(self):
+        set_backend(FakeBackend(latency=0, invalid_rate=1.0, seed=1))
+        config, contents = get_story_request("A1", None, None)
+        self.assertIsNone(get_gemini_response("gemini-2.5-flash", config, contents).parsed)
+
+    def test_stream(self):
+        set_backend(FakeBackend(latency=0, story_sentences=2, seed=1))
+        config, contents = get_story_request("A1", None, None)
+        text = "".join(stream_gemini_response("gemini-2.5-flash", config, contents))
+        self.assertEqual(len(Story.model_validate_json(text).sentences), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
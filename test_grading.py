@@ -0,0 +1,177 @@
+import os
+import time
+import unittest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+from grading import grade_locally, grade_answer, grade_batch, request_feedback, cache_stats, in_flight, CASCADE_MODEL
+from schemas import StorySentence, ReferenceStorySentence, Feedback, ConfidentFeedback, BatchFeedback, BatchFeedbackItem
+
+
+class TestGradeLocally(unittest.TestCase):
+    def setUp(self):
+        self.sentence = ReferenceStorySentence(
+            id=1,
+            german="Der Hund läuft schnell nach Hause.",
+            english="The dog runs home quickly.",
+            paraphrases=["The dog is running home fast."],
+            lemmas=["dog", "home"],
+        )
+
+    def test_reference_match(self):
+        self.assertTrue(grade_locally(self.sentence, "the dog runs home quickly"))
+        self.assertTrue(grade_locally(self.sentence, "The dog is running home fast!"))
+
+    def test_similar_with_lemmas(self):
+        self.assertTrue(grade_locally(self.sentence, "The dog is running home so fast."))
+        self.assertFalse(grade_locally(self.sentence, "The dog runs home slowly."))
+
+    def test_unclear_answers_escalate(self):
+        self.assertFalse(grade_locally(self.sentence, "The cat runs home quickly."))
+        self.assertFalse(grade_locally(self.sentence, "The dog does not run home quickly."))
+
+    def test_without_references(self):
+        sentence = StorySentence(id=1, german="Hallo!", english="Hello!")
+        self.assertTrue(grade_locally(sentence, "hello"))
+        self.assertFalse(grade_locally(sentence, "Hi!"))
+
+
+@mock.patch("grading.save_incorrect_answer")
+@mock.patch("grading.save_answer")
+class TestGradeBatch(unittest.TestCase):
+    def setUp(self):
+        self.sentences = [StorySentence(id=i, german=f"Satz {i}.", english=f"Sentence {i}.") for i in range(3)]
+        self.context = dict(mode="full", cache=None, text="Satz 0. Satz 1. Satz 2.")
+
+    @mock.patch.dict(os.environ, {"KUMPEL_RESPONSE_CACHE": "off"})
+    @mock.patch("responsecache.get_gemini_response")
+    @mock.patch("grading.lookup_answer")
+    def test_one_request_for_unresolved_answers(self, lookup_answer, get_gemini_response, save_answer, save_incorrect_answer):
+        lookup_answer.side_effect = [None, Feedback(correct=True, feedback=""), None]
+        results = [
+            BatchFeedbackItem(index=1, correct=False, feedback="Check the verb."),
+            BatchFeedbackItem(index=0, correct=True, feedback=""),
+        ]
+        get_gemini_response.return_value = SimpleNamespace(parsed=BatchFeedback(results=results))
+        pairs = [(sentence, "answer") for sentence in self.sentences]
+        feedbacks = grade_batch(pairs, self.context, "gemini-2.5-flash")
+        self.assertEqual(get_gemini_response.call_count, 1)
+        self.assertEqual([feedback.correct for feedback in feedbacks], [True, True, False])
+        self.assertEqual(feedbacks[2].feedback, "Check the verb.")
+        save_answer.assert_called_once_with(0, "answer")
+        save_incorrect_answer.assert_called_once_with(2, "answer", "Check the verb.")
+
+    @mock.patch.dict(os.environ, {"KUMPEL_RESPONSE_CACHE": "off"})
+    @mock.patch("responsecache.get_gemini_response")
+    @mock.patch("grading.time.sleep")
+    @mock.patch("grading.lookup_answer", return_value=None)
+    def test_messages_go_through_write(self, lookup_answer, sleep, get_gemini_response, save_answer, save_incorrect_answer):
+        # Batches are graded on worker threads, which must not print over the session
+        get_gemini_response.return_value = SimpleNamespace(parsed=None)
+        messages = []
+        pairs = [(sentence, "answer") for sentence in self.sentences]
+        with mock.patch("builtins.print") as print_mock:
+            with self.assertRaises(SystemExit):
+                grade_batch(pairs, self.context, "gemini-2.5-flash", messages.append)
+        print_mock.assert_not_called()
+        self.assertIn("Gemini response was invalid after multiple attempts. Exiting.", messages)
+
+
+@mock.patch.dict(os.environ, {"KUMPEL_GRADING_CASCADE": "1", "KUMPEL_CASCADE_THRESHOLD": "0.8"})
+@mock.patch("grading.save_incorrect_answer")
+@mock.patch("grading.save_answer")
+@mock.patch("grading.get_parsed_response")
+class TestGradingCascade(unittest.TestCase):
+    def setUp(self):
+        self.sentence = StorySentence(id=1, german="Der Hund läuft.", english="The dog runs.")
+        self.context = dict(mode="window", cache=None, text="Der Hund läuft.")
+
+    def test_confident(self, get_parsed_response, save_answer, save_incorrect_answer):
+        get_parsed_response.return_value = ConfidentFeedback(correct=True, feedback="", confidence=0.95)
+        feedback = request_feedback(self.sentence, "The dog runs.", self.context, "gemini-2.5-pro")
+        self.assertEqual(feedback, Feedback(correct=True, feedback=""))
+        self.assertEqual([call.args[0] for call in get_parsed_response.call_args_list], [CASCADE_MODEL])
+        save_answer.assert_called_once_with(1, "The dog runs.")
+
+    def test_escalation(self, get_parsed_response, save_answer, save_incorrect_answer):
+        get_parsed_response.side_effect = [
+            ConfidentFeedback(correct=True, feedback="", confidence=0.5),
+            Feedback(correct=False, feedback="Check the verb."),
+        ]
+        feedback = request_feedback(self.sentence, "The dog ran.", self.context, "gemini-2.5-pro")
+        self.assertFalse(feedback.correct)
+        self.assertEqual([call.args[0] for call in get_parsed_response.call_args_list], [CASCADE_MODEL, "gemini-2.5-pro"])
+        save_answer.assert_not_called()
+        save_incorrect_answer.assert_called_once_with(1, "The dog ran.", "Check the verb.")
+
+    def test_context_cache(self, get_parsed_response, save_answer, save_incorrect_answer):
+        get_parsed_response.return_value = Feedback(correct=True, feedback="")
+        context = dict(mode="cache", cache="cachedContents/story", text=None)
+        request_feedback(self.sentence, "The dog runs.", context, "gemini-2.5-pro")
+        self.assertEqual([call.args[0] for call in get_parsed_response.call_args_list], ["gemini-2.5-pro"])
+
+
+@mock.patch("grading.lookup_answer", return_value=None)
+@mock.patch("grading.request_feedback")
+class TestCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.sentence = StorySentence(id=1, german="Der Hund läuft.", english="The dog runs.")
+        self.context = dict(mode="full", cache=None, text="Der Hund läuft.")
+
+    def test_identical_checks_share_one_request(self, request_feedback, lookup_answer):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_feedback(*args):
+            started.set()
+            release.wait(5)
+            return Feedback(correct=False, feedback="Check the verb.")
+
+        request_feedback.side_effect = slow_feedback
+        coalesced = cache_stats["coalesced"]
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            first = executor.submit(grade_answer, self.sentence, "The dog walks.", self.context, "gemini-2.5-flash")
+            started.wait(5)
+            # Case and punctuation don't matter
+            others = [
+                executor.submit(grade_answer, self.sentence, answer, self.context, "gemini-2.5-flash")
+                for answer in ["the dog walks", "The  dog walks!"]
+            ]
+            while cache_stats["coalesced"] < coalesced + 2:
+                time.sleep(0.001)
+            release.set()
+            feedbacks = [first.result()] + [other.result() for other in others]
+        self.assertEqual(request_feedback.call_count, 1)
+        self.assertEqual({feedback.feedback for feedback in feedbacks}, {"Check the verb."})
+        self.assertEqual(in_flight, {})
+
+    def test_failure_reaches_waiting_checks(self, request_feedback, lookup_answer):
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing_feedback(*args):
+            started.set()
+            release.wait(5)
+            raise SystemExit(1)
+
+        request_feedback.side_effect = failing_feedback
+        coalesced = cache_stats["coalesced"]
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(grade_answer, self.sentence, "The dog walks.", self.context, "gemini-2.5-flash")
+            started.wait(5)
+            second = executor.submit(grade_answer, self.sentence, "The dog walks.", self.context, "gemini-2.5-flash")
+            while cache_stats["coalesced"] < coalesced + 1:
+                time.sleep(0.001)
+            release.set()
+            for future in [first, second]:
+                with self.assertRaises(SystemExit):
+                    future.result()
+        self.assertEqual(request_feedback.call_count, 1)
+        self.assertEqual(in_flight, {})
+
+    def test_different_answers_are_not_coalesced(self, request_feedback, lookup_answer):
+        request_feedback.return_value = Feedback(correct=True, feedback="")
+        grade_answer(self.sentence, "The dog runs.", self.context, "gemini-2.5-flash")
+        grade_answer(self.sentence, "The dog is running.", self.context, "gemini-2.5-flash")
+        self.assertEqual(request_feedback.call_count, 2)
@@ -0,0 +1,74 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from llm import get_retry_after, summarize_calls, record_call, get_gemini_response, set_backend, call_log, CALL_LOG_SIZE
+
+
+class TestRetryAfter(unittest.TestCase):
+    def test_retry_info(self):
+        details = {"error": {"code": 429, "details": [
+            {"@type": "type.googleapis.com/google.rpc.QuotaFailure"},
+            {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "23s"},
+        ]}}
+        error = SimpleNamespace(code=429, details=details, response=None)
+        self.assertEqual(get_retry_after(error), 23.0)
+
+    def test_header(self):
+        error = SimpleNamespace(code=503, details=None, response=SimpleNamespace(headers={"retry-after": "7"}))
+        self.assertEqual(get_retry_after(error), 7.0)
+
+    def test_no_hint(self):
+        self.assertIsNone(get_retry_after(Exception("boom")))
+
+
+class TestSummarizeCalls(unittest.TestCase):
+    def test_summary(self):
+        records = [
+            dict(seconds=1.0, wait_seconds=0.5, prompt_tokens=100, cached_tokens=0, response_tokens=10),
+            dict(seconds=2.0, wait_seconds=0.0, prompt_tokens=50, cached_tokens=40, response_tokens=5),
+        ]
+        summary = summarize_calls(records)
+        self.assertEqual(summary["calls"], 2)
+        self.assertEqual(summary["seconds"], 3.0)
+        self.assertEqual(summary["prompt_tokens"], 150)
+
+    @mock.patch("llm.save_call")
+    def test_call_log_is_capped(self, save_call):
+        for _ in range(CALL_LOG_SIZE + 1):
+            record_call("gemini-2.5-flash", 1.0, 1)
+        self.assertEqual(len(call_log), CALL_LOG_SIZE)
+        call_log.clear()
+
+
+class FlakyError(Exception):
+    code = 503
+
+
+class FlakyBackend:
+    # Fails with a 503 once, then answers
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, model, config, contents):
+        self.calls += 1
+        if self.calls == 1:
+            raise FlakyError("Service unavailable")
+        return SimpleNamespace(parsed=None, usage_metadata=None)
+
+
+@mock.patch.dict(os.environ, {"KUMPEL_RATE_LIMITS": "off"})
+@mock.patch("llm.save_llm_call")
+@mock.patch("llm.time.sleep")
+class TestWrite(unittest.TestCase):
+    def tearDown(self):
+        set_backend(None)
+
+    def test_retry_messages_go_through_write(self, sleep, save_llm_call):
+        set_backend(FlakyBackend())
+        messages = []
+        with mock.patch("builtins.print") as print_mock:
+            get_gemini_response("gemini-2.5-flash", SimpleNamespace(), "Hallo", write=messages.append)
+        print_mock.assert_not_called()
+        self.assertEqual(len(messages), 1)
+        self.assertIn("Code: 503", messages[0])
@@ -1,7 +1,134 @@
+import sys
 import unittest
+import subprocess
+from unittest import mock
+import main
+import threading
+from main import get_sentence_context, run_session, run_in_background, start_speculation, finish_speculation, release_speculation
+from bench_startup import DEFERRED_MODULES
+from schemas import Story, StorySentence, Feedback
 
 
 class TestTest(unittest.TestCase):
     def test_test(self):
         result = None
         self.assertEqual(result, None)
+
+
+class TestSentenceContext(unittest.TestCase):
+    def setUp(self):
+        german = ["Eins.", "Zwei.", "Drei.", "Vier.", "Fünf."]
+        sentences = [StorySentence(id=i, german=text, english="") for i, text in enumerate(german)]
+        self.story_context = dict(mode="window", sentences=sentences, window=1, cache=None)
+
+    def test_window(self):
+        context = get_sentence_context(self.story_context, 0)
+        self.assertEqual(context["text"], "Eins. Zwei.")
+        context = get_sentence_context(self.story_context, 2)
+        self.assertEqual(context["text"], "Zwei. Drei. Vier.")
+
+    def test_full(self):
+        self.story_context["mode"] = "full"
+        context = get_sentence_context(self.story_context, 4)
+        self.assertEqual(context["text"], "Eins. Zwei. Drei. Vier. Fünf.")
+
+
+@mock.patch("main.new_screen")
+@mock.patch("main.checkpoint_progress")
+@mock.patch("main.check_answer", return_value=Feedback(correct=True, feedback=""))
+@mock.patch("main.read_input", side_effect=lambda prompt: "The dog runs home.")
+class TestRunSession(unittest.TestCase):
+    def setUp(self):
+        sentences = [
+            StorySentence(id=1, german="Der Hund läuft nach Hause.", english="The dog runs home."),
+            StorySentence(id=2, german="Die Katze läuft nach Hause.", english="The cat runs home."),
+            StorySentence(id=3, german="Die Maus läuft nach Hause.", english="The mouse runs home."),
+        ]
+        self.story = dict(id=1, model="gemini-2.5-flash", content=Story(story_name="Test", sentences=sentences), stream=None)
+        self.story_context = dict(mode="full", sentences=sentences, window=2, cache=None)
+        main.story_progress = []
+
+    def tearDown(self):
+        main.story_progress = []
+
+    def test_learn_session(self, read_input, check_answer, checkpoint_progress, new_screen):
+        run_session(self.story, "learn", self.story_context)
+        self.assertEqual([call.args[1] for call in checkpoint_progress.call_args_list], [0, 1, 2])
+        self.assertEqual(len(main.story_progress), 3)
+
+    def test_resumed_session(self, read_input, check_answer, checkpoint_progress, new_screen):
+        self.story["passed"] = [0, 2]
+        run_session(self.story, "practice", self.story_context)
+        self.assertEqual([call.args[1] for call in checkpoint_progress.call_args_list], [1])
+
+
+class TestSpeculation(unittest.TestCase):
+    def test_daemon_thread(self):
+        # Quitting during the prompts must not wait for the request
+        started = threading.Event()
+        finish = threading.Event()
+        threads = []
+
+        def request_story(level, topic, style, model, write, cancelled):
+            threads.append(threading.current_thread())
+            started.set()
+            finish.wait(5)
+            return None if cancelled.is_set() else "story"
+
+        with mock.patch("main.request_story", side_effect=request_story):
+            speculation = start_speculation("A1", None, None, "gemini-2.5-flash")
+            started.wait(5)
+            release_speculation(speculation)
+            finish.set()
+            self.assertIsNone(speculation["future"].result(5))
+        self.assertTrue(threads[0].daemon)
+        self.assertTrue(speculation["cancelled"].is_set())
+
+    @mock.patch("main.new_screen")
+    def test_failure_is_shown(self, new_screen):
+        # A request which ends the run shows its messages first
+        def request_story(level, topic, style, model, write, cancelled):
+            write("Exiting. Goodbye!")
+            sys.exit(1)
+
+        with mock.patch("main.request_story", side_effect=request_story):
+            speculation = start_speculation("A1", None, None, "gemini-2.5-flash")
+            speculation["future"].exception(5)
+            with mock.patch("main.spinner") as spinner:
+                with self.assertRaises(SystemExit):
+                    finish_speculation(speculation, speculation["key"])
+        spinner.return_value.__enter__.return_value.write.assert_called_once_with("Exiting. Goodbye!")
+
+
+class TestRunInBackground(unittest.TestCase):
+    def test_cancel_waiting(self):
+        # Test mode batches run on daemon threads, and the ones waiting for a
+        # worker are dropped on Ctrl-C
+        workers = threading.BoundedSemaphore(1)
+        started = threading.Event()
+        finish = threading.Event()
+        threads = []
+
+        def grade(name):
+            threads.append(threading.current_thread())
+            started.set()
+            finish.wait(5)
+            return name
+
+        running = run_in_background(grade, "running", workers=workers)
+        started.wait(5)
+        waiting = run_in_background(grade, "waiting", workers=workers)
+        self.assertTrue(waiting.cancel())
+        finish.set()
+        self.assertEqual(running.result(5), "running")
+        self.assertTrue(threads[0].daemon)
+        self.assertEqual(len(threads), 1)
+
+
+class TestStartup(unittest.TestCase):
+    def test_heavy_imports_are_deferred(self):
+        code = "import sys, main; print(' '.join(sys.modules))"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        modules = result.stdout.split()
+        for module in DEFERRED_MODULES:
+            self.assertNotIn(module, modules)
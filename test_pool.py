@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+from db import count_pool_stories, load_pool_stats
+from pool import store_story, take_story, refill_pool
+from schemas import Story, StorySentence, ReferenceStory, ReferenceStorySentence
+from tempdb import TempDBTestCase
+
+
+KEY = ("A1", None, None, "gemini-2.5-flash")
+
+
+class TestPool(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.story = Story(story_name="Test Story", sentences=[StorySentence(id=1, german="Hallo!", english="Hello!")])
+
+    @mock.patch("pool.request_story")
+    def test_take_story(self, request_story):
+        self.assertIsNone(take_story(KEY))
+        store_story(KEY, self.story)
+        self.assertEqual(take_story(KEY), self.story)
+        # Replacements are left to --refill-pool
+        request_story.assert_not_called()
+        self.assertIsNone(take_story(("A1", "Cats", None, "gemini-2.5-flash")))
+        self.assertEqual(count_pool_stories(*KEY), 0)
+        pool_stat = next(row for row in load_pool_stats() if row["topic"] is None)
+        self.assertEqual((pool_stat["hits"], pool_stat["misses"]), (1, 1))
+
+    def test_take_reference_story(self):
+        sentence = ReferenceStorySentence(id=1, german="Hallo!", english="Hello!", paraphrases=["Hi!"], lemmas=["hello"])
+        story = ReferenceStory(story_name="Test Story", sentences=[sentence])
+        store_story(KEY, story)
+        self.assertEqual(take_story(KEY), story)
+
+    @mock.patch("pool.request_story")
+    def test_refill_pool(self, request_story):
+        request_story.return_value = self.story
+        store_story(KEY, self.story)
+        result = refill_pool(keys=[KEY, ("B1", None, None, "gemini-2.5-flash")], size=2)
+        self.assertEqual(result, dict(requested=3, generated=3))
+        self.assertEqual(count_pool_stories(*KEY), 2)
+        self.assertEqual(count_pool_stories("B1", None, None, "gemini-2.5-flash"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
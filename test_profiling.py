@@ -0,0 +1,51 @@
+import os
+import json
+import pstats
+import unittest
+import tempfile
+from unittest import mock
+import profiling
+from profiling import span, run_profiled
+
+
+@span("inner")
+def inner():
+    return 42
+
+
+def outer():
+    with span("outer"):
+        return inner()
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.profile_path = os.path.join(self.directory.name, "kumpel.prof")
+        self.trace_path = os.path.join(self.directory.name, "kumpel-trace.json")
+        profiling.trace_events.clear()
+
+    def tearDown(self):
+        profiling.trace_events.clear()
+        self.directory.cleanup()
+
+    def test_spans_are_off_by_default(self):
+        self.assertEqual(outer(), 42)
+        self.assertEqual(profiling.trace_events, [])
+
+    @mock.patch("builtins.print")
+    def test_run_profiled(self, print):
+        self.assertEqual(run_profiled(outer, self.profile_path, self.trace_path), 42)
+        with open(self.trace_path) as trace:
+            events = json.load(trace)["traceEvents"]
+        spans = {event["name"]: event for event in events if event["ph"] == "X"}
+        self.assertEqual(set(spans), {"outer", "inner"})
+        self.assertGreaterEqual(spans["inner"]["ts"], spans["outer"]["ts"])
+        self.assertLessEqual(spans["inner"]["dur"], spans["outer"]["dur"])
+        self.assertTrue(any(event["ph"] == "M" for event in events))
+        self.assertIn("outer", {function[2] for function in pstats.Stats(self.profile_path).stats})
+        self.assertFalse(profiling.enabled)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import unittest
+from unittest import mock
+import ratelimit
+from ratelimit import TokenBucket, get_rate_limits, acquire, settle, penalize
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_reserve_within_budget(self):
+        bucket = TokenBucket(60, updated_at=0)
+        self.assertEqual(bucket.reserve(1, 0), 0.0)
+        self.assertEqual(bucket.level, 59)
+
+    def test_reserve_waits_for_deficit(self):
+        bucket = TokenBucket(60, level=0, updated_at=0)
+        self.assertAlmostEqual(bucket.reserve(1, 0), 1.0)
+        self.assertAlmostEqual(bucket.reserve(1, 0), 2.0)
+        self.assertAlmostEqual(bucket.reserve(1, 3), 0.0)
+
+    def test_refill_is_capped(self):
+        bucket = TokenBucket(10, level=0, updated_at=0)
+        bucket.refill(3600)
+        self.assertEqual(bucket.level, 10)
+
+    def test_drain(self):
+        bucket = TokenBucket(10, updated_at=0)
+        bucket.drain(0)
+        self.assertEqual(bucket.level, 0)
+
+
+class TestRateLimits(unittest.TestCase):
+    @mock.patch.dict(os.environ, {"KUMPEL_RATE_LIMITS": "gemini-2.5-flash=10/250000"})
+    def test_override(self):
+        limits = get_rate_limits()
+        self.assertEqual(limits["gemini-2.5-flash"], (10, 250000))
+        self.assertEqual(limits["gemini-2.5-pro"], (150, 2000000))
+
+    @mock.patch.dict(os.environ, {"KUMPEL_RATE_LIMITS": "off"})
+    def test_off(self):
+        self.assertEqual(get_rate_limits(), {})
+
+    @mock.patch.dict(os.environ, {"KUMPEL_RATE_LIMITS": "gemini-2.5-flash=1000/1000000", "KUMPEL_RATE_LIMIT_STATE": "1"})
+    @mock.patch("ratelimit.save_rate_limit", side_effect=sqlite3.OperationalError("database is locked"))
+    @mock.patch("ratelimit.load_rate_limits", side_effect=sqlite3.OperationalError("database is locked"))
+    @mock.patch.dict(ratelimit.buckets, clear=True)
+    def test_database_errors(self, load_rate_limits, save_rate_limit):
+        # A locked database never fails a request
+        self.assertEqual(acquire("gemini-2.5-flash", 100), 0.0)
+        settle("gemini-2.5-flash", 100, 80)
+        penalize("gemini-2.5-flash")
+        self.assertEqual(save_rate_limit.call_count, 3)
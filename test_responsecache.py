@@ -0,0 +1,77 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from google.genai import types
+from db import get_db
+from responsecache import get_request_key, get_parsed_response
+from generation import request_story
+from schemas import Feedback, Story, StorySentence
+from tempdb import TempDBTestCase
+
+
+def get_config(system_instruction="Check my translation."):
+    return types.GenerateContentConfig(
+        system_instruction=system_instruction,
+        response_mime_type="application/json",
+        response_schema=Feedback,
+    )
+
+
+@mock.patch("responsecache.get_gemini_response")
+class TestResponseCache(TempDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.feedback = Feedback(correct=True, feedback="Well done.")
+
+    def test_request_key(self, get_gemini_response):
+        key = get_request_key("gemini-2.5-flash", get_config(), "Hallo")
+        self.assertEqual(key, get_request_key("gemini-2.5-flash", get_config(), "Hallo"))
+        self.assertNotEqual(key, get_request_key("gemini-2.5-pro", get_config(), "Hallo"))
+        self.assertNotEqual(key, get_request_key("gemini-2.5-flash", get_config("Grade it."), "Hallo"))
+        self.assertNotEqual(key, get_request_key("gemini-2.5-flash", get_config(), "Tschüss"))
+
+    def test_repeated_request(self, get_gemini_response):
+        get_gemini_response.return_value = SimpleNamespace(parsed=self.feedback)
+        self.assertEqual(get_parsed_response("gemini-2.5-flash", get_config(), "Hallo"), self.feedback)
+        self.assertEqual(get_parsed_response("gemini-2.5-flash", get_config(), "Hallo"), self.feedback)
+        self.assertEqual(get_gemini_response.call_count, 1)
+        get_parsed_response("gemini-2.5-flash", get_config(), "Hallo", refresh=True)
+        get_parsed_response("gemini-2.5-flash", get_config(), "Hallo", cache=False)
+        self.assertEqual(get_gemini_response.call_count, 3)
+
+    def test_opt_out(self, get_gemini_response):
+        get_gemini_response.return_value = SimpleNamespace(parsed=self.feedback)
+        with mock.patch.dict(os.environ, {"KUMPEL_RESPONSE_CACHE": "off"}):
+            get_parsed_response("gemini-2.5-flash", get_config(), "Hallo")
+            get_parsed_response("gemini-2.5-flash", get_config(), "Hallo")
+        self.assertEqual(get_gemini_response.call_count, 2)
+
+    def test_stories_are_not_cached(self, get_gemini_response):
+        # Asking for another story with the same choices gives a new one
+        story = Story(story_name="Test Story", sentences=[StorySentence(id=1, german="Hallo!", english="Hello!")])
+        get_gemini_response.return_value = SimpleNamespace(parsed=story)
+        request_story("A1", None, None, "gemini-2.5-flash")
+        request_story("A1", None, None, "gemini-2.5-flash")
+        self.assertEqual(get_gemini_response.call_count, 2)
+        count = get_db().execute("SELECT count(*) AS count FROM response_cache").fetchone()["count"]
+        self.assertEqual(count, 0)
+
+    def test_eviction(self, get_gemini_response):
+        get_gemini_response.return_value = SimpleNamespace(parsed=self.feedback)
+        with mock.patch.dict(os.environ, {"KUMPEL_RESPONSE_CACHE_SIZE": "2"}):
+            get_parsed_response("gemini-2.5-flash", get_config(), "Eins")
+            get_parsed_response("gemini-2.5-flash", get_config(), "Zwei")
+            get_parsed_response("gemini-2.5-flash", get_config(), "Eins")
+            get_parsed_response("gemini-2.5-flash", get_config(), "Drei")
+            get_parsed_response("gemini-2.5-flash", get_config(), "Eins")
+        self.assertEqual(get_gemini_response.call_count, 3)
+        count = get_db().execute("SELECT count(*) AS count FROM response_cache").fetchone()["count"]
+        self.assertEqual(count, 2)
+        with mock.patch.dict(os.environ, {"KUMPEL_RESPONSE_CACHE_TTL": "-1"}):
+            get_parsed_response("gemini-2.5-flash", get_config(), "Eins")
+        self.assertEqual(get_gemini_response.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
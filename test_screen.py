@@ -0,0 +1,40 @@
+import io
+import os
+import unittest
+from unittest import mock
+from screen import Screen
+from main import get_screen_lines
+
+
+@mock.patch.dict(os.environ, {"COLUMNS": "80", "LINES": "30"})
+class TestScreen(unittest.TestCase):
+    def setUp(self):
+        self.output = io.StringIO()
+        self.screen = Screen(self.output)
+
+    def render(self, lines):
+        start = self.output.tell()
+        self.screen.render(lines)
+        return self.output.getvalue()[start:]
+
+    def test_redraws_changed_lines(self):
+        first = self.render(["Header", "", "Progress (1/3)", "Eins.", ""])
+        self.assertIn("\033[2J", first)
+        second = self.render(["Header", "", "Progress (2/3)", "Eins.", "Zwei.", ""])
+        self.assertNotIn("\033[2J", second)
+        self.assertNotIn("Header", second)
+        self.assertNotIn("Eins.", second)
+        self.assertIn("\033[3;1HProgress (2/3)", second)
+        self.assertIn("\033[5;1HZwei.", second)
+        self.assertTrue(second.endswith("\033[7;1H\033[J"))
+
+    def test_long_progress_is_shortened(self):
+        story_progress = [f"Satz {i}." for i in range(50)]
+        lines = get_screen_lines("Header", story_progress, 50, self.screen.get_max_lines())
+        self.assertEqual(len(lines), self.screen.get_max_lines())
+        self.assertEqual(lines[-2], "Satz 49.")
+        self.assertTrue(self.render(lines).startswith("\033[21;30r"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import asyncio
+import unittest
+from unittest import mock
+from db import save_story
+from llm import set_backend
+from fakebackend import FakeBackend
+from schemas import Story, StorySentence
+from server import KumpelServer
+from bench_server import Client
+from tempdb import use_temp_db
+
+
+@mock.patch.dict(os.environ, {"KUMPEL_RATE_LIMITS": "off", "KUMPEL_RESPONSE_CACHE": "off"})
+class TestServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        use_temp_db(self)
+        sentences = [
+            StorySentence(id=1, german="Der Hund läuft.", english="The dog runs."),
+            StorySentence(id=2, german="Die Katze schläft.", english="The cat sleeps."),
+        ]
+        content = Story(story_name="Test Story", sentences=sentences)
+        self.story_id = save_story(dict(level="A1", topic=None, style=None, model="gemini-2.5-flash", content=content))
+        set_backend(FakeBackend(latency=0, correct_rate=1.0, seed=1))
+        self.server = KumpelServer(workers=2)
+        port = asyncio.Future()
+        self.serve = asyncio.create_task(self.server.serve("127.0.0.1", 0, port.set_result))
+        self.client = Client(await port)
+
+    async def asyncTearDown(self):
+        self.client.close()
+        self.serve.cancel()
+        self.server.executor.shutdown()
+        set_backend(None)
+
+    async def test_session(self):
+        status, page = await self.client.request("GET", "/stories")
+        self.assertEqual([story["name"] for story in page["stories"]], ["Test Story"])
+        status, page = await self.client.request("GET", "/stories?q=katze&level=A1")
+        self.assertEqual(([story["id"] for story in page["stories"]], page["next"]), ([self.story_id], None))
+        status, page = await self.client.request("GET", "/stories?q=vogel")
+        self.assertEqual(page["stories"], [])
+        status, session = await self.client.request("POST", "/sessions", dict(story_id=self.story_id, mode="practice"))
+        self.assertEqual((status, session["german"], session["length"]), (201, "Der Hund läuft.", 2))
+        status, result = await self.client.request("POST", f"/sessions/{session['id']}/answers", dict(answer="The dog runs."))
+        self.assertTrue(result["correct"])
+        self.assertEqual(result["session"]["german"], "Die Katze schläft.")
+        status, result = await self.client.request("POST", f"/sessions/{session['id']}/answers", dict(answer="The cat is sleeping."))
+        self.assertTrue(result["correct"])
+        self.assertTrue(result["session"]["done"])
+        self.assertEqual(result["session"]["progress"], ["Der Hund läuft.", "Die Katze schläft."])
+
+    async def test_errors(self):
+        status, result = await self.client.request("POST", "/sessions", dict(story_id=self.story_id, mode="exam"))
+        self.assertEqual(status, 400)
+        status, result = await self.client.request("POST", "/sessions", dict(story_id=self.story_id + 1))
+        self.assertEqual(status, 404)
+        status, result = await self.client.request("POST", "/sessions/missing/answers", dict(answer="Hello"))
+        self.assertEqual(status, 404)
+        status, result = await self.client.request("DELETE", "/stories")
+        self.assertEqual(status, 405)
+        for limit in ["0", "-1", "101"]:
+            status, result = await self.client.request("GET", f"/stories?limit={limit}")
+            self.assertEqual(status, 400)
+        status, result = await self.client.request("POST", "/sessions", [self.story_id])
+        self.assertEqual(status, 400)
+        with mock.patch.object(self.server, "route", side_effect=RuntimeError("crash")):
+            with mock.patch("traceback.print_exc"):
+                status, result = await self.client.request("GET", "/stats")
+        self.assertEqual(status, 500)
+        # The connection is still usable
+        status, result = await self.client.request("GET", "/stats")
+        self.assertEqual(status, 200)
+
+    async def test_session_eviction(self):
+        with mock.patch("server.MAX_SESSIONS", 1):
+            status, first = await self.client.request("POST", "/sessions", dict(story_id=self.story_id))
+            status, second = await self.client.request("POST", "/sessions", dict(story_id=self.story_id))
+        status, result = await self.client.request("GET", f"/sessions/{first['id']}")
+        self.assertEqual(status, 404)
+        status, result = await self.client.request("GET", f"/sessions/{second['id']}")
+        self.assertEqual(status, 200)
+        with mock.patch("server.SESSION_TTL_SECONDS", -1):
+            await self.server.evict_sessions()
+        self.assertEqual(self.server.sessions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from stats import get_percentile, get_call_stats
+
+
+def get_llm_call(seconds, purpose="grade", mode="test", sentences=1, cache_hit=0):
+    return dict(model="gemini-2.5-flash", purpose=purpose, mode=mode, sentences=sentences, prompt_tokens=90,
+                cached_tokens=0, response_tokens=10, seconds=seconds, retries=0, wait_seconds=0.0,
+                cache_hit=cache_hit, cost=0.001)
+
+
+class TestStats(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(get_percentile(values, 50), 50)
+        self.assertEqual(get_percentile(values, 95), 95)
+        self.assertEqual(get_percentile([3.0], 95), 3.0)
+        self.assertIsNone(get_percentile([], 50))
+
+    def test_call_stats(self):
+        llm_calls = [get_llm_call(seconds) for seconds in [1.0, 2.0, 3.0]]
+        llm_calls.append(get_llm_call(0.001, cache_hit=1))
+        llm_calls.append(get_llm_call(4.0, sentences=4))
+        llm_calls.append(get_llm_call(8.0, purpose="generate", mode=None, sentences=10))
+        generate, grade = get_call_stats(llm_calls)
+        self.assertEqual((generate["purpose"], generate["mode"], generate["tokens_per_sentence"]), ("generate", "", 10))
+        self.assertEqual((grade["calls"], grade["cache_hits"]), (5, 1))
+        self.assertEqual((grade["p50"], grade["p95"]), (2.0, 4.0))
+        self.assertEqual(grade["tokens_per_sentence"], 500 / 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import unittest
+from unittest import mock
+from schemas import Story
+from streaming import StoryParser, StoryStream
+
+
+STORY = {
+    "story_name": "Der \"kleine\" Hund",
+    "sentences": [
+        {"id": 1, "german": "Der Hund läuft.", "english": "The dog runs."},
+        {"id": 2, "german": "Er ist {froh}.", "english": "He is [happy]."},
+    ],
+}
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestStoryParser(unittest.TestCase):
+    def test_incremental(self):
+        parser = StoryParser()
+        items = []
+        for chunk in chunked(json.dumps(STORY, indent=2), 7):
+            items.extend(parser.feed(chunk))
+            if items:
+                self.assertEqual(parser.story_name, STORY["story_name"])
+        self.assertEqual(items, STORY["sentences"])
+
+    def test_first_sentence_before_end(self):
+        parser = StoryParser()
+        text = json.dumps(STORY)
+        cut = text.index('{"id": 2')
+        self.assertEqual(parser.feed(text[:cut]), STORY["sentences"][:1])
+        self.assertEqual(parser.feed(text[cut:]), STORY["sentences"][1:])
+
+
+class TestStoryStream(unittest.TestCase):
+    @mock.patch("streaming.stream_gemini_response")
+    def test_stream(self, stream_gemini_response):
+        stream_gemini_response.return_value = iter(chunked(json.dumps(STORY), 5))
+        stream = StoryStream("gemini-2.5-flash", None, "", Story)
+        self.assertTrue(stream.wait_for_start())
+        self.assertEqual([sentence.id for sentence in stream], [1, 2])
+        self.assertIsNone(stream.error)
+        self.assertEqual(stream.result().story_name, STORY["story_name"])
+
+    @mock.patch("streaming.stream_gemini_response")
+    def test_broken_stream_keeps_received_sentences(self, stream_gemini_response):
+        text = json.dumps(STORY)
+        stream_gemini_response.return_value = iter([text[:text.index('{"id": 2')]])
+        stream = StoryStream("gemini-2.5-flash", None, "", Story)
+        self.assertEqual([sentence.id for sentence in stream], [1])
+        self.assertIsNotNone(stream.error)
+        self.assertEqual(len(stream.result().sentences), 1)
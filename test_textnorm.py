@@ -0,0 +1,17 @@
+import unittest
+from textnorm import normalize_answer, answer_similarity
+
+
+class TestNormalizeAnswer(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize_answer("The dog runs."), "the dog runs")
+        self.assertEqual(normalize_answer("I'm here, aren't I?"), "i am here are not i")
+        self.assertEqual(normalize_answer("It’s a well-known   fact"), "it is a well known fact")
+        # "I'd" can be "I had" or "I would"
+        self.assertNotEqual(normalize_answer("I'd gone"), normalize_answer("I would gone"))
+
+    def test_similarity(self):
+        self.assertEqual(answer_similarity("the dog runs.", "The dog runs"), 1.0)
+        self.assertGreater(answer_similarity("The dog is running fast", "The dog is running very fast"), 0.8)
+        self.assertEqual(answer_similarity("The dog runs", "The dog does not run"), 0.0)
+        self.assertEqual(answer_similarity("I have 2 cats", "I have 3 cats"), 0.0)
@@ -0,0 +1,101 @@
+import re
+import unicodedata
+
+
+# English contractions expanded before comparing answers
+CONTRACTIONS = {
+    "won't": "will not",
+    "can't": "can not",
+    "cannot": "can not",
+    "shan't": "shall not",
+    "let's": "let us",
+    "i'm": "i am",
+    "it's": "it is",
+    "he's": "he is",
+    "she's": "she is",
+    "that's": "that is",
+    "there's": "there is",
+    "here's": "here is",
+    "what's": "what is",
+    "who's": "who is",
+    "where's": "where is",
+    "how's": "how is",
+}
+
+
+# Contraction suffixes expanded after the whole-word contractions. 'd is
+# left alone, as it can mean "would" or "had".
+CONTRACTION_SUFFIXES = [
+    ("n't", " not"),
+    ("'re", " are"),
+    ("'ll", " will"),
+    ("'ve", " have"),
+]
+
+
+# Words which flip the meaning of an answer
+NEGATIONS = {"not", "no", "never", "nothing", "nobody", "none", "nor", "neither", "nowhere"}
+
+
+def normalize_answer(answer):
+    text = unicodedata.normalize("NFKC", answer).lower()
+    text = text.replace("’", "'").replace("‘", "'")
+    words = []
+    for word in text.split():
+        word = word.strip(".,;:!?\"()[]")
+        if word in CONTRACTIONS:
+            word = CONTRACTIONS[word]
+        else:
+            for suffix, expansion in CONTRACTION_SUFFIXES:
+                if word.endswith(suffix):
+                    word = word[:-len(suffix)] + expansion
+                    break
+        words.append(word)
+    text = " ".join(words)
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def get_ngrams(text, n=3):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def answer_similarity(answer, accepted):
+    # Dice coefficient over character trigrams of the normalised answers.
+    # Answers that differ in negation or numbers never count as similar.
+    answer = normalize_answer(answer)
+    accepted = normalize_answer(accepted)
+    if answer == accepted:
+        return 1.0
+    answer_tokens = set(answer.split())
+    accepted_tokens = set(accepted.split())
+    if answer_tokens & NEGATIONS != accepted_tokens & NEGATIONS:
+        return 0.0
+    if {t for t in answer_tokens if t.isdigit()} != {t for t in accepted_tokens if t.isdigit()}:
+        return 0.0
+    answer_ngrams = get_ngrams(answer)
+    accepted_ngrams = get_ngrams(accepted)
+    if not answer_ngrams or not accepted_ngrams:
+        return 0.0
+    return 2 * len(answer_ngrams & accepted_ngrams) / (len(answer_ngrams) + len(accepted_ngrams))
+
+
+def stem_word(word):
+    # Crude suffix stripping, enough to match "runs" or "running" to "run"
+    for suffix in ["ing", "ed", "es", "s"]:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    if len(word) > 3 and word[-1] == word[-2]:
+        word = word[:-1]
+    return word
+
+
+def lemmas_covered(answer, lemmas):
+    stems = {stem_word(word) for word in normalize_answer(answer).split()}
+    for lemma in lemmas:
+        lemma_stems = [stem_word(word) for word in normalize_answer(lemma).split()]
+        if not all(lemma_stem in stems for lemma_stem in lemma_stems):
+            return False
+    return True